@@ -1,4 +1,5 @@
 from graphs import *
+from crossfilter import CrossFilter
 import altair as alt
 import streamlit as st
 
@@ -7,15 +8,53 @@ st.set_page_config(layout="centered", page_title="NYC Traffic Accidents")
 
 @st.cache_data
 def get_data():
-    accident_data = pd.read_csv("clean_data.csv")
- 
-    return accident_data
+    accident_data = load_clean_data("clean_data.csv", columns=vis_cols)
 
+    return accident_data, get_fingerprint(accident_data)
 
-# @st.cache_data
-def get_graph(data):
-    vis = make_visualization(data)
-    return vis
+
+# The built chart is cached as its Vega-Lite spec, which avoids rebuilding the
+# charts and serializing the dataset on every rerun. The data itself is not
+# hashed (leading underscore), the cache is keyed on its fingerprint and on the
+# layout parameters instead. With static_data, the datasets are written to files
+# served by Streamlit and the spec references them by URL, so that browsers
+# cache them instead of receiving them with every chart (see to_static_urls).
+@st.cache_data(max_entries=8)
+def get_graph(
+    _data,
+    fingerprint,
+    w=800,
+    use_interval=True,
+    aggregated=False,
+    density=None,
+    resolution="medium",
+    filter_points=False,
+    render="default",
+    static_data=False,
+):
+    vis = make_visualization(
+        _data,
+        use_interval=use_interval,
+        w=w,
+        aggregated=aggregated,
+        density=density,
+        resolution=resolution,
+        filter_points=filter_points,
+        render=render,
+    )
+    spec = vis.to_dict()
+    if static_data:
+        return to_static_urls(spec)
+    return spec
+
+
+# When cross-filtering on the server, the chart only holds the counts of each
+# view, which are recomputed from the selections reported by the chart on each
+# rerun. The engine keeps the indexes of the data, so it is shared by all the
+# sessions instead of being copied, with the count cubes of the views.
+@st.cache_resource
+def get_crossfilter(_data, fingerprint):
+    return CrossFilter(_data)
 
 
 # make sidebar with instructions
@@ -28,6 +67,25 @@ with st.sidebar:
     st.write(
         "_Important_: We strongly suggest using light mode. You can clicking on the dots in the top right corner of the page to change the theme."
     )
+    server_side = st.toggle(
+        "Filter on the server",
+        help="Only send the counts of each view to the browser, recomputed on every selection. Faster on large datasets.",
+    )
+    density = st.toggle(
+        "Density map",
+        help="Draw the number of accidents in hexagonal cells instead of each accident. Faster on large datasets. Not used when filtering on the server.",
+    )
+    resolution = st.select_slider(
+        "Map resolution",
+        options=list(map_resolutions),
+        value="medium",
+        disabled=not density,
+        help="The size of the cells of the density map.",
+    )
+    filter_points = st.toggle(
+        "Only draw the selected accidents",
+        help="Remove the accidents outside of the selections of the map instead of hiding them, over the density of all the accidents. Not used with the density map or when filtering on the server.",
+    )
     if st.button("Clear Selection"):
         st.write("Clearing selection")
     with st.expander("How to use"):
@@ -51,10 +109,31 @@ with st.sidebar:
             - **IMPORTANT**: In some cases the interactions may not work as expected. If this happens, please refresh the page and try again.
             For further help, more detailed instructions on how to use it are available by going to the instructions page"""
         )
-accident_data = get_data()
-vis = get_graph(accident_data)
+accident_data, fingerprint = get_data()
 st.title("NYC Traffic Accidents")
+# large datasets are drawn on a canvas, with a throttled map brush
+render = "large" if len(accident_data) >= large_data_rows else "default"
 
-
-st.altair_chart(vis)
+if server_side:
+    engine = get_crossfilter(accident_data, fingerprint)
+    vis = get_graph(
+        accident_data, fingerprint, aggregated="crossfilter", render=render
+    )
+    # the state of the selections of the previous run of the chart
+    event = st.session_state.get("crossfilter_chart") or {}
+    # the datasets have fixed names, so only the data changes between reruns
+    datasets = engine.datasets(event.get("selection"))
+    vis = dict(vis, datasets={**vis.get("datasets", {}), **datasets})
+    st.vega_lite_chart(vis, on_select="rerun", key="crossfilter_chart")
+else:
+    vis = get_graph(
+        accident_data,
+        fingerprint,
+        density="hex" if density else None,
+        resolution=resolution,
+        filter_points=filter_points,
+        render=render,
+        static_data=st.get_option("server.enableStaticServing"),
+    )
+    st.vega_lite_chart(vis)
 print("done")
@@ -0,0 +1,102 @@
+"""
+Latency of the map brush of the cross-filter, with and without the table of
+the rows of each map point.
+
+The accidents are resampled to each size, with their coordinates jittered
+within a grid cell so that the boxes do not select whole duplicates. The map
+brush of the chart holds the ids of the points under it ({"_vgsid_":
+"Set(1,2,3)"}, see crossfilter.CrossFilter): the ids of the points in a box
+around a few blocks and around Midtown Manhattan are sent to the cross-filter,
+which counts the views from the rows of these points only (get_rows), or from
+a mask of all the accidents. The best time of several queries is reported,
+with the number of accidents under the brush, which the first grows with.
+
+Usage (from the repository root):
+    python -m benchmarks.brush [--sizes 10000 100000 1000000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from crossfilter import CrossFilter
+from graphs import load_clean_data, vis_cols
+
+# The brush boxes, as ranges of coordinates
+boxes = {
+    "blocks": {"LATITUDE": [40.755, 40.758], "LONGITUDE": [-73.988, -73.984]},
+    "midtown": {"LATITUDE": [40.74, 40.77], "LONGITUDE": [-74.0, -73.97]},
+}
+
+
+def best_time(function, repeat):
+    """
+    Returns the best time in seconds of several calls of a function.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def get_brush(engine, box):
+    """
+    Returns the value of the map brush selecting the points inside a box.
+    """
+    _, keys = engine.groups["map"]
+    (low, high), (left, right) = box["LATITUDE"], box["LONGITUDE"]
+    inside = (
+        keys["LATITUDE"].between(low, high) & keys["LONGITUDE"].between(left, right)
+    ).to_numpy()
+    ids = np.nonzero(inside)[0] + 1
+    return {"_vgsid_": f"Set({','.join(map(str, ids))})"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--data", default="clean_data.csv")
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    accident_data = load_clean_data(args.data, columns=vis_cols)
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        data = accident_data.sample(size, replace=True, random_state=0)
+        data = data.reset_index(drop=True)
+        for col in ["LATITUDE", "LONGITUDE"]:
+            data[col] = data[col] + rng.uniform(-0.0025, 0.0025, size)
+
+        start = time.perf_counter()
+        engine = CrossFilter(data)
+        build = time.perf_counter() - start
+
+        for name, box in boxes.items():
+            brush = get_brush(engine, box)
+
+            def rows():
+                engine._rows = None
+                return engine.count("vehicle", {"selection_acc_map": brush})
+
+            def mask():
+                engine._rows = None
+                engine._masks.clear()
+                mask = engine.get_mask("selection_acc_map", brush)
+                return engine._count("vehicle", mask)
+
+            selected = len(engine.get_rows(brush["_vgsid_"]))
+            indexed = best_time(rows, args.repeat)
+            scanned = best_time(mask, args.repeat)
+            print(
+                f"{size:>10} accidents {name:<8} {selected:>8} selected  "
+                f"rows {indexed * 1000:7.3f} ms  mask {scanned * 1000:7.3f} ms  "
+                f"(built in {build * 1000:.0f} ms)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Size of the count cubes of the cross-filter and latency of its queries, with
+and without them, on synthetic accidents.
+
+The accidents are resampled to each size and each of their dimensions is
+jittered: a share of the rows gets the value of another random row for it, so
+that the combinations of values are not only the ones of the real extract,
+whose few thousand accidents would otherwise be repeated. The number of cells
+of a single cube over all the dimensions of the selections is reported with
+the cells of the cubes of the views under the selections of the queries.
+
+A session is a sequence of clicks on the charts (queries): a first selection,
+then other values of the same selections. The time of the first query, which
+builds the cubes of these selections, and the best time of the next ones are
+reported, with cubes (CrossFilter(data)) and counting the accidents
+(CrossFilter(data, cubes=0)).
+
+Usage (from the repository root):
+    python -m benchmarks.cube [--sizes 100000 1000000] [--jitter 0.3]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from crossfilter import CrossFilter
+from graphs import load_clean_data, selection_fields, vis_cols
+
+# The fields derived from the date of the accidents
+date_fields = ["fulldate", "monthname", "dayname", "week", "num_days_in_month"]
+
+# The clicks of each session, as the selections of the chart
+sessions = {
+    "borough": [
+        {"selection_buro": [{"name": name}]}
+        for name in ["Queens", "Brooklyn", "Manhattan", "Bronx"]
+    ],
+    "hours": [
+        {
+            "selection_buro": [{"name": "Brooklyn"}],
+            "time_brush": {"HOUR": [hour, hour + 3]},
+        }
+        for hour in range(6, 18, 2)
+    ],
+    "weather": [
+        {
+            "selection_cond": [{"conditions": conditions}],
+            "selection_month": [{"monthname": "July"}],
+            "selection_injured": [{"INJURED": "with injuries"}],
+        }
+        for conditions in ["Clear", "Rain", "Partially cloudy", "Overcast"]
+    ],
+}
+
+
+def jitter_dimensions(data, share, rng):
+    """
+    Gives a share of the rows the value of another random row for each
+    dimension of the selections but the coordinates. The fields derived from
+    the date are replaced together, as they are by the preprocessing.
+    """
+    data = data.copy()
+    dimensions = [
+        fields
+        for name, fields in selection_fields.items()
+        if name != "selection_acc_map" and not set(fields) & set(date_fields)
+    ]
+    for fields in dimensions + [date_fields]:
+        replaced = np.nonzero(rng.random(len(data)) < share)[0]
+        donors = rng.integers(0, len(data), len(replaced))
+        for field in fields:
+            # keeps the categories of the loaded data
+            data.iloc[replaced, data.columns.get_loc(field)] = data[field].iloc[
+                donors
+            ].to_numpy()
+    return data
+
+
+def time_session(engine, clicks):
+    """
+    Returns the time in seconds of the first query of a session and the best
+    time of the next ones.
+    """
+    times = []
+    for selections in clicks:
+        start = time.perf_counter()
+        engine.query(selections)
+        times.append(time.perf_counter() - start)
+    return times[0], min(times[1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--data", default="clean_data.csv")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100_000, 1_000_000])
+    parser.add_argument("--jitter", type=float, default=0.3)
+    args = parser.parse_args()
+
+    accident_data = load_clean_data(args.data, columns=vis_cols)
+    rng = np.random.default_rng(0)
+    dims = sorted(
+        {f for name, fields in selection_fields.items() for f in fields}
+        - set(selection_fields["selection_acc_map"])
+    )
+    for size in args.sizes:
+        data = accident_data.sample(size, replace=True, random_state=0)
+        data = jitter_dimensions(data.reset_index(drop=True), args.jitter, rng)
+        cells = data.groupby(dims, observed=True, dropna=False).ngroups
+        print(f"{size:,} accidents: {cells:,} cells over all the dimensions")
+
+        cubes = CrossFilter(data)
+        rows = CrossFilter(data, cubes=0)
+        for name, clicks in sessions.items():
+            cubes.cubes.clear()
+            first, cube_time = time_session(cubes, clicks)
+            _, row_time = time_session(rows, clicks)
+            sizes = [len(engine.data) for engine in cubes.cubes.values()]
+            print(
+                f"  {name:<8} {len(sizes)} cubes of {min(sizes):,} to "
+                f"{max(sizes):,} cells  first {first * 1000:7.1f} ms  "
+                f"next {cube_time * 1000:6.2f} ms with cubes, "
+                f"{row_time * 1000:6.2f} ms without"
+            )
+
+
+if __name__ == "__main__":
+    main()
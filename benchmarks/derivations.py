@@ -0,0 +1,35 @@
+"""
+Per-row cost of the derived-column stage of the preprocessing.
+
+Usage (from the repository root):
+    python -m benchmarks.derivations [n_rows ...]
+"""
+import sys
+import time
+
+from benchmarks.synthetic import make_accidents
+from graphs import derive_accident_columns, parse_crash_datetime
+
+
+def time_derivations(n, repeat=3):
+    """
+    Times derive_accident_columns on n synthetic rows.
+
+    Returns:
+    - seconds: float - Best wall time over the repetitions.
+    """
+    df = parse_crash_datetime(make_accidents(n))
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        derive_accident_columns(df)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1:]] or [100_000, 1_000_000, 10_000_000]
+    print(f"{'rows':>12} {'seconds':>10} {'ns/row':>10}")
+    for n in sizes:
+        seconds = time_derivations(n, repeat=3 if n < 10_000_000 else 1)
+        print(f"{n:>12,} {seconds:>10.3f} {seconds / n * 1e9:>10.1f}")
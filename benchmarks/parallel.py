@@ -0,0 +1,58 @@
+"""
+Scaling of the parallel preprocessing (clean_partitions) with the number of
+worker processes, on synthetic raw records.
+
+Usage (from the repository root):
+    python -m benchmarks.parallel [--rows N] [--processes 1 2 4 ...]
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import make_accidents
+from graphs import clean_accident_data, clean_partitions, get_weather_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--processes", type=int, nargs="+")
+    parser.add_argument("--partitions", type=int, help="number of date ranges")
+    parser.add_argument("--boroughs", help="file with the borough polygons")
+    parser.add_argument("--weather", default="weather2018.csv")
+    args = parser.parse_args()
+
+    cores = os.cpu_count()
+    processes = args.processes or sorted(
+        {1, *(2**i for i in range(1, cores.bit_length()) if 2**i <= cores), cores}
+    )
+    raw = make_accidents(args.rows)
+
+    start = time.perf_counter()
+    expected = get_weather_data(
+        clean_accident_data(raw.copy(), boroughs=args.boroughs), args.weather
+    )
+    serial = time.perf_counter() - start
+    print(f"{args.rows:,} raw rows, {len(expected):,} accidents, {cores} cores")
+    print(f"{'processes':>9} {'seconds':>9} {'speedup':>9}")
+    print(f"{'serial':>9} {serial:>9.2f} {1:>9.2f}")
+
+    for n in processes:
+        start = time.perf_counter()
+        result = clean_partitions(
+            raw,
+            args.weather,
+            processes=n,
+            partitions=args.partitions,
+            boroughs=args.boroughs,
+        )
+        seconds = time.perf_counter() - start
+        # the partitions must combine into the serial result
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"{n:>9} {seconds:>9.2f} {serial / seconds:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Frame time of the dashboard chart with each rendering profile.
+
+The chart of each profile (see graphs.render_profiles) is compiled to Vega
+once, then rendered headlessly with vl-convert for a sequence of frames, one
+for each state of the borough selection, as when clicking through the
+boroughs. The median time of a frame is reported, with the number of scene
+items in interactive marks, which the browser hit-tests on every pointer
+event. The canvas profiles are timed by building the scenegraph and the SVG
+profile by building its SVG markup. Painting, hover processing and the
+throttling of the brush events only happen in a browser, so they are not
+measured.
+
+Usage (from the repository root):
+    python -m benchmarks.render [--rows 200000] [--profiles default large]
+"""
+import argparse
+import statistics
+import time
+
+import vl_convert as vlc
+
+from graphs import load_clean_data, make_visualization, render_profiles, vis_cols
+
+
+def set_borough(vega_spec, unit, borough):
+    """
+    Sets the borough selected in a compiled chart (none if borough is None).
+    """
+    for data in vega_spec["data"]:
+        if data["name"] == "selection_buro_store":
+            data["values"] = []
+            if borough is not None:
+                fields = [{"type": "E", "field": "name"}]
+                data["values"] = [
+                    {"unit": unit, "fields": fields, "values": [borough]}
+                ]
+
+
+def get_unit(spec):
+    """
+    Returns the name of the view which holds the borough selection.
+    """
+    spec = dict(spec)
+    spec["params"] = [
+        dict(param, value=[{"name": ""}])
+        if param["name"] == "selection_buro"
+        else param
+        for param in spec["params"]
+    ]
+    for data in vlc.vegalite_to_vega(spec)["data"]:
+        if data["name"] == "selection_buro_store":
+            return data["values"][0]["unit"]
+
+
+def count_items(scene):
+    """
+    Counts the items of the interactive marks of a scenegraph.
+    """
+    count = 0
+    if scene.get("role") == "mark" and scene.get("interactive"):
+        count += len(scene.get("items", []))
+    for item in scene.get("items", []):
+        if isinstance(item, dict):
+            count += count_items(item)
+    return count
+
+
+def time_frames(vega_spec, unit, boroughs, renderer):
+    """
+    Renders a frame for each selected borough.
+
+    Returns:
+    - times: list - Time in seconds of each frame.
+    - items: int - Number of items of the interactive marks, without selection.
+    """
+    times = []
+    items = None
+    for borough in boroughs:
+        set_borough(vega_spec, unit, borough)
+        start = time.perf_counter()
+        if renderer == "svg":
+            vlc.vega_to_svg(vega_spec)
+        else:
+            scene = vlc.vega_to_scenegraph(vega_spec)
+        times.append(time.perf_counter() - start)
+        if items is None:
+            if renderer == "svg":
+                scene = vlc.vega_to_scenegraph(vega_spec)
+            items = count_items(scene["scenegraph"])
+    return times, items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--data", default="clean_data.csv")
+    parser.add_argument("--rows", type=int)
+    parser.add_argument("--profiles", nargs="+", default=list(render_profiles))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    accident_data = load_clean_data(args.data, columns=vis_cols)
+    if args.rows:
+        # resampled, to measure larger datasets than the one available
+        accident_data = accident_data.sample(
+            args.rows, replace=True, random_state=0
+        ).reset_index(drop=True)
+    boroughs = [None] + sorted(accident_data["name"].dropna().unique().tolist())
+    print(f"{len(accident_data)} accidents, {len(boroughs)} frames")
+
+    for filter_points in [False, True]:
+        mode = "filtered map" if filter_points else "highlighted map"
+        for profile in args.profiles:
+            spec = make_visualization(
+                accident_data, filter_points=filter_points, render=profile
+            ).to_dict()
+            vega_spec = vlc.vegalite_to_vega(spec)
+            unit = get_unit(spec)
+            renderer = render_profiles[profile]["embed"].get("renderer", "canvas")
+            times = []
+            for _ in range(args.repeat):
+                frames, items = time_frames(vega_spec, unit, boroughs, renderer)
+                times += frames
+            print(
+                f"{mode:<16} {profile:<8} {renderer:<6} "
+                f"{statistics.median(times) * 1000:8.1f} ms/frame "
+                f"{items:8d} interactive items"
+            )
+
+
+if __name__ == "__main__":
+    main()
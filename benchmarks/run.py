@@ -0,0 +1,206 @@
+"""
+Benchmark of the preprocessing and chart-building pipeline on synthetic data.
+
+For each number of raw records, a synthetic CSV file is generated (see
+benchmarks/synthetic.py) and every stage of the pipeline is timed: CSV parse,
+date parsing and filtering, derivations, spatial join, weather merge, spec
+build and serialization. The peak memory of each stage and the size of the
+output spec are also reported. The results are written as JSON and compared
+against a stored baseline.
+
+Usage (from the repository root):
+    python -m benchmarks.run --rows 10000 100000 1000000
+    python -m benchmarks.run --rows 10000 --save-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import write_accidents
+from graphs import (
+    assign_boroughs,
+    derive_accident_columns,
+    filter_accident_dates,
+    get_weather_data,
+    make_visualization,
+    parse_crash_datetime,
+    vis_cols,
+)
+
+baseline_path = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# A stage is reported as a regression when it is this much slower than the
+# baseline
+tolerance = 1.2
+
+
+def _reset_peak_rss():
+    """
+    Resets the peak resident memory of the process (Linux only).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    """
+    Returns the peak resident memory of the process since the last reset, in
+    MB, or None if it is not available.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _timed(results, stage, func, *args, **kwargs):
+    """
+    Runs a stage of the pipeline, recording its wall time and peak memory.
+    """
+    _reset_peak_rss()
+    start = time.perf_counter()
+    out = func(*args, **kwargs)
+    results[stage] = {
+        "seconds": time.perf_counter() - start,
+        "peak_mb": _peak_rss(),
+    }
+    return out
+
+
+def run_pipeline(fname, boroughs=None, weather="weather2018.csv", **vis_kwargs):
+    """
+    Runs the whole pipeline on a raw accident CSV file, timing each stage.
+
+    Parameters:
+    - fname: str - Path to the raw accident CSV file.
+    - boroughs: str, optional - File with the borough polygons, see
+      get_buroughs.
+    - weather: str - Path to the weather CSV file.
+    - vis_kwargs: Arguments for make_visualization.
+
+    Returns:
+    - result: dict - Time and peak memory of each stage, and sizes.
+    """
+    stages = {}
+    df = _timed(stages, "csv_parse", pd.read_csv, fname)
+    n_raw = len(df)
+
+    def parse_dates(df):
+        return filter_accident_dates(parse_crash_datetime(df))
+
+    df = _timed(stages, "parse_dates", parse_dates, df)
+    df = _timed(stages, "derivations", derive_accident_columns, df)
+
+    def spatial_join(df):
+        return assign_boroughs(df.dropna(subset=["LATITUDE", "LONGITUDE"]), boroughs)
+
+    df = _timed(stages, "spatial_join", spatial_join, df)
+    df = _timed(stages, "weather_merge", get_weather_data, df, weather)
+    chart = _timed(stages, "spec_build", make_visualization, df[vis_cols], **vis_kwargs)
+    spec = _timed(stages, "serialization", chart.to_json)
+
+    return {
+        "raw_rows": n_raw,
+        "clean_rows": len(df),
+        "spec_bytes": len(spec),
+        "stages": stages,
+    }
+
+
+def compare(results, baseline):
+    """
+    Prints the time of each stage relative to the baseline, for the sizes
+    present in both.
+
+    Returns:
+    - regressions: list - (rows, stage, ratio) of the stages slower than the
+      baseline by more than tolerance.
+    """
+    regressions = []
+    previous = {r["raw_rows"]: r for r in baseline["runs"]}
+    for run in results["runs"]:
+        base = previous.get(run["raw_rows"])
+        if base is None:
+            continue
+        print(f"\n{run['raw_rows']:,} rows vs baseline")
+        for stage, values in run["stages"].items():
+            if stage not in base["stages"]:
+                continue
+            ratio = values["seconds"] / max(base["stages"][stage]["seconds"], 1e-9)
+            flag = "  SLOWER" if ratio > tolerance else ""
+            print(f"  {stage:<14} {ratio:>6.2f}x{flag}")
+            if ratio > tolerance:
+                regressions.append((run["raw_rows"], stage, ratio))
+        ratio = run["spec_bytes"] / max(base["spec_bytes"], 1)
+        print(f"  {'spec size':<14} {ratio:>6.2f}x")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--boroughs", help="file with the borough polygons")
+    parser.add_argument("--weather", default="weather2018.csv")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=baseline_path)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="store the results as baseline"
+    )
+    parser.add_argument("--aggregated", action="store_true")
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "boroughs": args.boroughs,
+        "aggregated": args.aggregated,
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            fname = os.path.join(tmp, f"accidents_{n}.csv")
+            write_accidents(fname, n)
+            run = run_pipeline(
+                fname, args.boroughs, args.weather, aggregated=args.aggregated
+            )
+            os.remove(fname)
+            results["runs"].append(run)
+
+            print(
+                f"\n{n:,} raw rows -> {run['clean_rows']:,} accidents, "
+                f"spec {run['spec_bytes']:,} bytes"
+            )
+            print(f"  {'stage':<14} {'seconds':>9} {'peak MB':>9}")
+            for stage, values in run["stages"].items():
+                peak = values["peak_mb"]
+                peak = f"{peak:>9.0f}" if peak is not None else f"{'-':>9}"
+                print(f"  {stage:<14} {values['seconds']:>9.3f} {peak}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than the baseline")
+
+
+if __name__ == "__main__":
+    main()
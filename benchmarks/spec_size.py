@@ -0,0 +1,41 @@
+"""
+Size of the Vega-Lite spec of the visualization with each data option.
+
+Usage (from the repository root):
+    python -m benchmarks.spec_size [clean_data.csv]
+"""
+import json
+import sys
+
+from graphs import load_clean_data, make_visualization, vis_cols
+
+options = [
+    ("rows, no projection", dict(projection=None)),
+    ("rows, shared projection", dict(projection="shared")),
+    ("rows, dictionary-encoded", dict(dictionary=True)),
+    ("aggregated, shared projection", dict(aggregated=True, projection="shared")),
+    ("aggregated, dictionary-encoded", dict(aggregated=True, dictionary=True)),
+]
+
+
+def spec_sizes(accident_data):
+    """
+    Builds the visualization with each option of options.
+
+    Returns:
+    - sizes: list - (option, spec bytes, number of datasets) tuples.
+    """
+    sizes = []
+    for name, kwargs in options:
+        spec = make_visualization(accident_data, **kwargs).to_json()
+        sizes.append((name, len(spec), len(json.loads(spec)["datasets"])))
+    return sizes
+
+
+if __name__ == "__main__":
+    fname = sys.argv[1] if len(sys.argv) > 1 else "clean_data.csv"
+    accident_data = load_clean_data(fname, columns=vis_cols)
+    print(f"{len(accident_data):,} accidents")
+    print(f"{'option':<34} {'bytes':>12} {'datasets':>9}")
+    for name, size, datasets in spec_sizes(accident_data):
+        print(f"{name:<34} {size:>12,} {datasets:>9}")
@@ -0,0 +1,84 @@
+"""
+Import time of the modules the dashboard loads at startup.
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+several times, and the best cumulative time of the module and of the slowest
+modules it imports directly is reported. The modules which only the
+preprocessing needs (the geospatial stack) must not be imported by the
+dashboard: the benchmark fails if any of them is.
+
+Usage (from the repository root):
+    python -m benchmarks.startup [--modules graphs crossfilter] [--repeat 5]
+"""
+import argparse
+import subprocess
+import sys
+
+# Modules which must not be imported when the dashboard starts
+etl_modules = ["geopandas", "geodatasets", "shapely", "pyproj", "boroughs"]
+
+
+def import_times(module):
+    """
+    Imports a module in a fresh interpreter.
+
+    Parameters:
+    - module: str - The module to import.
+
+    Returns:
+    - times: dict - Cumulative import time in seconds of each imported module,
+      by name.
+    - children: list - The modules imported directly by the module (the
+      last one imported).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    # the imports of a module are listed before it, indented one level more
+    stack = [[]]
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        times[name] = int(cumulative) / 1e6
+        while len(stack) <= depth + 1:
+            stack.append([])
+        children = stack[depth + 1]
+        del stack[depth + 1 :]
+        stack[depth].append(name)
+    return times, children
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modules", nargs="+", default=["graphs", "crossfilter"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(args.repeat)]
+        best = {
+            name: min(times.get(name, 0) for times, _ in runs) for name in runs[0][0]
+        }
+        print(f"import {module}: {best[module]:.3f} s")
+        slowest = sorted(runs[0][1], key=best.get, reverse=True)
+        for name in slowest[: args.top]:
+            print(f"  {name:<24} {best[name]:.3f} s")
+        loaded = [name for name in etl_modules if name in best]
+        if loaded:
+            failed = True
+            print(f"  imports preprocessing modules: {', '.join(loaded)}")
+    sys.exit(failed)
+
+
+if __name__ == "__main__":
+    main()
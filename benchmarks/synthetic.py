@@ -0,0 +1,128 @@
+"""
+Synthetic NYC collision records with the same columns as the raw dataset,
+used to benchmark the preprocessing at sizes larger than the real extract.
+
+The records are resampled from the accidents in clean_data.csv, so that the
+hours, locations, contributing factors, injuries and the rest of the columns
+follow their real distributions. Dates are uniform over the requested range,
+coordinates are jittered, a share of the records has no coordinates, and most
+records are of vehicle types which the preprocessing filters out, as in the
+full feed.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from graphs import factor_names
+
+# Columns of the raw dataset, as kept at the start of clean_data.csv
+raw_columns = [
+    "CRASH DATE",
+    "CRASH TIME",
+    "BOROUGH",
+    "ZIP CODE",
+    "LATITUDE",
+    "LONGITUDE",
+    "LOCATION",
+    "ON STREET NAME",
+    "CROSS STREET NAME",
+    "OFF STREET NAME",
+    "NUMBER OF PERSONS INJURED",
+    "NUMBER OF PERSONS KILLED",
+    "NUMBER OF PEDESTRIANS INJURED",
+    "NUMBER OF PEDESTRIANS KILLED",
+    "NUMBER OF CYCLIST INJURED",
+    "NUMBER OF CYCLIST KILLED",
+    "NUMBER OF MOTORIST INJURED",
+    "NUMBER OF MOTORIST KILLED",
+    "CONTRIBUTING FACTOR VEHICLE 1",
+    "CONTRIBUTING FACTOR VEHICLE 2",
+    "CONTRIBUTING FACTOR VEHICLE 3",
+    "CONTRIBUTING FACTOR VEHICLE 4",
+    "CONTRIBUTING FACTOR VEHICLE 5",
+    "COLLISION_ID",
+    "VEHICLE TYPE CODE 1",
+    "VEHICLE TYPE CODE 2",
+    "VEHICLE TYPE CODE 3",
+    "VEHICLE TYPE CODE 4",
+    "VEHICLE TYPE CODE 5",
+]
+
+# Raw names of the kept vehicle types, and vehicle types filtered out
+raw_vehicles = {"TAXI": "Taxi", "AMBULANCE": "Ambulance", "FIRE": "Fire Truck"}
+other_vehicles = [
+    "Sedan",
+    "Station Wagon/Sport Utility Vehicle",
+    "Pick-up Truck",
+    "Box Truck",
+    "Bus",
+    "Bike",
+]
+
+
+@lru_cache(maxsize=None)
+def get_sample(fname="clean_data.csv"):
+    """
+    Reads the raw columns of the cleaned dataset which the records are
+    resampled from, once per process.
+    """
+    df = pd.read_csv(fname, usecols=raw_columns + ["HOUR"])
+    # restore the raw names of the vehicles and contributing factors
+    df["VEHICLE TYPE CODE 1"] = df["VEHICLE TYPE CODE 1"].map(raw_vehicles)
+    raw_factors = {v: k for k, v in factor_names.items()}
+    df["CONTRIBUTING FACTOR VEHICLE 1"] = df["CONTRIBUTING FACTOR VEHICLE 1"].map(
+        lambda x: raw_factors.get(x, x)
+    )
+    return df
+
+
+def make_accidents(
+    n,
+    seed=0,
+    start="2018-06-01",
+    end="2018-09-30",
+    other_share=0.9,
+    missing_share=0.07,
+):
+    """
+    Generates n synthetic raw accident records.
+
+    Parameters:
+    - n: int - Number of records.
+    - seed: int - Seed of the random generator.
+    - start, end: str - First and last day of the records.
+    - other_share: float - Share of records with a vehicle type which is
+      filtered out.
+    - missing_share: float - Share of records without coordinates.
+
+    Returns:
+    - df: DataFrame - The synthetic records, with the raw columns.
+    """
+    rng = np.random.default_rng(seed)
+    sample = get_sample()
+    df = sample.iloc[rng.integers(0, len(sample), n)].reset_index(drop=True)
+
+    days = pd.date_range(start, end, freq="D")
+    df["CRASH DATE"] = days[rng.integers(0, len(days), n)].strftime(
+        "%Y-%m-%dT00:00:00Z"
+    )
+    minutes = pd.Series(rng.integers(0, 60, n)).astype(str).str.zfill(2)
+    df["CRASH TIME"] = df.pop("HOUR").astype(str) + ":" + minutes
+
+    jitter = rng.normal(0, 0.003, (n, 2))
+    missing = rng.random(n) < missing_share
+    df["LATITUDE"] = np.where(missing, np.nan, df["LATITUDE"] + jitter[:, 0])
+    df["LONGITUDE"] = np.where(missing, np.nan, df["LONGITUDE"] + jitter[:, 1])
+
+    other = rng.random(n) < other_share
+    df.loc[other, "VEHICLE TYPE CODE 1"] = rng.choice(other_vehicles, other.sum())
+    df["COLLISION_ID"] = np.arange(n) + 3_900_000
+    return df[raw_columns]
+
+
+def write_accidents(fname, n, seed=0, **kwargs):
+    """
+    Writes n synthetic raw accident records to a CSV file, see make_accidents.
+    """
+    make_accidents(n, seed, **kwargs).to_csv(fname, index=False)
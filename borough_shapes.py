@@ -0,0 +1,209 @@
+"""
+Simplified and quantized versions of the borough polygons drawn by the map.
+
+The full resolution GeoJSON shipped with the repository is 1.7 MB. This module
+simplifies it at several tolerances and writes each level as a quantized,
+delta-encoded TopoJSON file in geo/, which the map inlines in the chart.
+
+Usage (from the repository root), to rebuild the levels and print a size and
+render time comparison:
+    python borough_shapes.py
+"""
+import gzip
+import json
+import os
+import time
+from functools import lru_cache
+
+import altair as alt
+import numpy as np
+
+source = "new-york-city-boroughs.geojson"
+shapes_dir = "geo"
+
+# Simplification tolerance of each level, in degrees (0.0001 deg ~ 10 m)
+levels = {"full": 0, "high": 0.0001, "medium": 0.0005, "low": 0.002}
+
+# Number of quantization steps along each axis of the bounding box
+quantization = 100_000
+
+
+def get_shapes_path(level):
+    """
+    Returns the path of the TopoJSON file of a simplification level.
+    """
+    return os.path.join(shapes_dir, f"boroughs_{level}.topojson")
+
+
+def _rings(geometry):
+    """
+    Returns the polygons of a (Multi)Polygon geometry as lists of rings.
+    """
+    if geometry.geom_type == "Polygon":
+        polygons = [geometry]
+    else:
+        polygons = list(geometry.geoms)
+    return [
+        [polygon.exterior.coords] + [ring.coords for ring in polygon.interiors]
+        for polygon in polygons
+    ]
+
+
+def make_topology(fname=source, tolerance=0.0005, q=quantization):
+    """
+    Simplifies the borough polygons and encodes them as a TopoJSON topology.
+    Each ring becomes an arc of quantized, delta-encoded coordinates.
+
+    Parameters:
+    - fname: str - Path to the borough GeoJSON file.
+    - tolerance: float - Simplification tolerance, in degrees. 0 keeps all the
+      vertices.
+    - q: int - Quantization steps along each axis.
+
+    Returns:
+    - topology: dict - The TopoJSON topology, with the "boroughs" object.
+    """
+    # only needed to rebuild the levels, not to serve them
+    import shapely
+
+    with open(fname) as f:
+        features = json.load(f)["features"]
+    geometries = [shapely.geometry.shape(f["geometry"]) for f in features]
+    if tolerance > 0:
+        geometries = shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+    xmin, ymin, xmax, ymax = shapely.total_bounds(geometries)
+    scale = [(xmax - xmin) / (q - 1), (ymax - ymin) / (q - 1)]
+    translate = [xmin, ymin]
+
+    arcs = []
+    objects = []
+    for feature, geometry in zip(features, geometries):
+        polygons = []
+        for rings in _rings(geometry):
+            polygon = []
+            for ring in rings:
+                coords = np.asarray(ring)
+                points = np.round((coords - translate) / scale).astype(np.int64)
+                # drop the vertices that collapse into the previous one
+                keep = np.ones(len(points), dtype=bool)
+                keep[1:] = (np.diff(points, axis=0) != 0).any(axis=1)
+                points = points[keep]
+                if len(points) < 4:
+                    continue
+                deltas = np.vstack([points[:1], np.diff(points, axis=0)])
+                polygon.append(len(arcs))
+                arcs.append(deltas.tolist())
+            if polygon:
+                polygons.append([[arc] for arc in polygon])
+        objects.append(
+            {
+                "type": "MultiPolygon",
+                "arcs": polygons,
+                "properties": {"name": feature["properties"]["name"]},
+            }
+        )
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": scale, "translate": translate},
+        "objects": {"boroughs": {"type": "GeometryCollection", "geometries": objects}},
+        "arcs": arcs,
+    }
+
+
+def write_levels(fname=source):
+    """
+    Writes the TopoJSON file of every simplification level.
+    """
+    os.makedirs(shapes_dir, exist_ok=True)
+    for level, tolerance in levels.items():
+        topology = make_topology(fname, tolerance)
+        with open(get_shapes_path(level), "w") as f:
+            json.dump(topology, f, separators=(",", ":"))
+
+
+def compare_levels(repeat=3):
+    """
+    Prints the size of each level, raw and gzip-compressed, and the time to
+    render a map of it to SVG with vl-convert, if it is installed. The
+    original GeoJSON is included as the reference.
+    """
+    try:
+        import vl_convert as vlc
+    except ImportError:
+        vlc = None
+
+    def render_time(data):
+        if vlc is None:
+            return float("nan")
+        spec = (
+            alt.Chart(data)
+            .mark_geoshape(fill="lightgrey", stroke="white")
+            .project(type="albersUsa")
+            .properties(width=560, height=600)
+            .to_dict()
+        )
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            vlc.vegalite_to_svg(spec)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    with open(source) as f:
+        geojson = json.load(f)
+    rows = [
+        (
+            "geojson",
+            os.path.getsize(source),
+            len(gzip.compress(json.dumps(geojson).encode())),
+            render_time(
+                alt.Data(values=geojson, format=alt.DataFormat(property="features"))
+            ),
+        )
+    ]
+    for level in levels:
+        rows.append(
+            (
+                level,
+                os.path.getsize(get_shapes_path(level)),
+                len(gzip.compress(open(get_shapes_path(level), "rb").read())),
+                render_time(get_shapes_data(level)),
+            )
+        )
+
+    print(f"{'level':>8} {'bytes':>10} {'gzip':>10} {'render ms':>10}")
+    for level, size, compressed, seconds in rows:
+        print(f"{level:>8} {size:>10,} {compressed:>10,} {seconds * 1000:>10.1f}")
+
+
+def get_shapes_data(level="medium"):
+    """
+    Returns the borough shapes of a simplification level as inline chart data.
+
+    Parameters:
+    - level: str - One of the keys of levels.
+
+    Returns:
+    - data: alt.InlineData - The TopoJSON topology, with the "boroughs"
+      feature.
+    """
+    return alt.InlineData(
+        values=read_topology(level),
+        format=alt.DataFormat(type="topojson", feature="boroughs"),
+    )
+
+
+@lru_cache(maxsize=None)
+def read_topology(level):
+    """
+    Reads the TopoJSON topology of a simplification level, once per process.
+    """
+    with open(get_shapes_path(level)) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    write_levels()
+    compare_levels()
@@ -0,0 +1,109 @@
+"""
+Point-in-borough assignment for the accident coordinates.
+"""
+import numpy as np
+import shapely
+
+
+class BoroughLookup:
+    """
+    Assigns points to the polygons of a set of boroughs.
+
+    The polygons are prepared and indexed with an STR-tree once. A regular grid
+    over their bounding box is precomputed, in which each cell is marked as
+    lying completely inside one polygon, completely outside all of them or
+    crossing a boundary. Only the points falling in boundary cells need an
+    exact polygon test.
+
+    Parameters:
+    - geometries: array of shapely geometries - The borough polygons, in the
+      same coordinate system as the points (longitude, latitude).
+    - grid_size: int - Number of grid cells along each axis.
+    """
+
+    OUTSIDE = -1
+    BOUNDARY = -2
+
+    def __init__(self, geometries, grid_size=128):
+        self.geometries = np.asarray(geometries, dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.bounds = shapely.total_bounds(self.geometries)
+        self.grid_size = grid_size
+        self.grid = self._build_grid()
+
+    def _build_grid(self):
+        xmin, ymin, xmax, ymax = self.bounds
+        xs = np.linspace(xmin, xmax, self.grid_size + 1)
+        ys = np.linspace(ymin, ymax, self.grid_size + 1)
+        x0, y0 = np.meshgrid(xs[:-1], ys[:-1])
+        x1, y1 = np.meshgrid(xs[1:], ys[1:])
+        cells = shapely.box(x0.ravel(), y0.ravel(), x1.ravel(), y1.ravel())
+
+        grid = np.full(len(cells), self.OUTSIDE, dtype=np.int64)
+        cell_idx, geom_idx = self.tree.query(cells)
+        for geom in np.unique(geom_idx):
+            candidates = cell_idx[geom_idx == geom]
+            polygon = self.geometries[geom]
+            touched = candidates[shapely.intersects(polygon, cells[candidates])]
+            grid[touched] = np.where(
+                grid[touched] == self.OUTSIDE, self.BOUNDARY, grid[touched]
+            )
+            grid[touched[shapely.contains(polygon, cells[touched])]] = geom
+        return grid.reshape(self.grid_size, self.grid_size)
+
+    def _cells(self, x, y):
+        """
+        Returns the grid cell of each point, or -1 for points outside the
+        bounding box of the polygons (or with missing coordinates).
+        """
+        xmin, ymin, xmax, ymax = self.bounds
+        (inside,) = np.nonzero((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))
+        col = ((x[inside] - xmin) / (xmax - xmin) * self.grid_size).astype(np.int64)
+        row = ((y[inside] - ymin) / (ymax - ymin) * self.grid_size).astype(np.int64)
+        col = np.minimum(col, self.grid_size - 1)
+        row = np.minimum(row, self.grid_size - 1)
+        cells = np.full(len(x), -1, dtype=np.int64)
+        cells[inside] = row * self.grid_size + col
+        return cells
+
+    def lookup(self, x, y, batch_size=1_000_000):
+        """
+        Finds the polygon containing each point.
+
+        Parameters:
+        - x: array - Longitudes of the points.
+        - y: array - Latitudes of the points.
+        - batch_size: int - Maximum number of points tested at once.
+
+        Returns:
+        - idx: array of int - Position of the polygon containing each point,
+          or -1 if it is not inside any of them.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        idx = np.full(len(x), self.OUTSIDE, dtype=np.int64)
+        for start in range(0, len(x), batch_size):
+            end = min(start + batch_size, len(x))
+            idx[start:end] = self._lookup_batch(x[start:end], y[start:end])
+        return idx
+
+    def _lookup_batch(self, x, y):
+        cells = self._cells(x, y)
+        idx = np.where(cells >= 0, self.grid.ravel()[cells], self.OUTSIDE)
+
+        # exact test for the points in cells crossing a boundary
+        (pending,) = np.nonzero(idx == self.BOUNDARY)
+        idx[pending] = self.OUTSIDE
+        # the STR-tree gives the candidate polygons by bounding box, which are
+        # then tested polygon by polygon against the prepared geometry
+        point_idx, geom_idx = self.tree.query(shapely.points(x[pending], y[pending]))
+        # iterating in reverse, a point on the border of two polygons keeps
+        # the first one
+        for geom in np.unique(geom_idx)[::-1]:
+            candidates = pending[point_idx[geom_idx == geom]]
+            hit = shapely.intersects_xy(
+                self.geometries[geom], x[candidates], y[candidates]
+            )
+            idx[candidates[hit]] = geom
+        return idx
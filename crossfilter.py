@@ -0,0 +1,295 @@
+"""
+Cross-filtering of the views of the visualization in Python.
+
+By default every accident is embedded in the chart and each view filters all
+of them in the browser on every interaction. With a CrossFilter, the chart only
+holds the counts of each view (make_visualization(aggregated="crossfilter")).
+The state of the selections, as reported by Streamlit's chart selection
+events, is applied here and only the re-aggregated counts are sent back, so the
+size of the chart and the work done in the browser do not grow with the data.
+
+Usage:
+    engine = CrossFilter(accident_data)
+    spec = make_visualization(None, aggregated="crossfilter").to_dict()
+    spec["datasets"] = engine.datasets(event["selection"])
+"""
+import json
+import re
+
+import numpy as np
+
+from cube import build_cube
+from graphs import (
+    get_dataset_name,
+    selection_fields,
+    snap_coordinates,
+    view_fields,
+    view_filters,
+)
+
+
+class CrossFilter:
+    """
+    Counts the accidents of each view under the selections of the other views.
+
+    The fields of each point selection are indexed on its first use: the rows
+    get an integer code for each distinct value (combination) of the fields.
+    A point selection then becomes a row mask by looking up the codes in a
+    table of the selected values, whatever the number of values selected.
+    Interval selections are range comparisons. The rows are
+    also coded by the groups of each view, so that counting is a single
+    bincount of the filtered codes. The mask of each selection is kept until
+    its value changes, so a click only recomputes the selection it changes.
+
+    In the chart, the map brush holds the ids (_vgsid_) of the points under it
+    rather than a range of coordinates. The points of the map are its groups,
+    so each one is sent with the id of its group (its code plus one), which
+    Vega keeps. The rows are sorted by map group once, with the position of
+    the first row of each group, so that the rows of the groups under the
+    brush are read as slices: the views are then counted from these rows only
+    and the other selections are only read at them, so that moving the brush
+    costs in proportion to the accidents under it, not to all of them.
+
+    The data can also be a count cube (see cube.py), whose rows are weighted
+    by their number of accidents "n". The views and selections whose fields
+    are not in the data, such as the map without coordinates, are left out.
+    Every view but the map is counted from its cube for the selections which
+    filter it, built on the first use of these selections. As a click on a
+    chart changes the values of a selection, not which selections are set,
+    the next queries read the cells of the cubes instead of the accidents.
+    The map brush is read from the accidents (see get_rows).
+
+    Parameters:
+    - accident_data: DataFrame - The accident data, with the columns in
+      view_fields and selection_fields, or a count cube.
+    - grid: float - The size in degrees of the grid the coordinates of the map
+      are snapped to, see snap_coordinates.
+    - cubes: int - The number of cubes kept, the least recently used ones
+      being dropped. 0 counts every view from the data.
+    """
+
+    def __init__(self, accident_data, grid=0.005, cubes=64):
+        columns = {f for fields in view_fields.values() for f in fields}
+        columns |= {f for fields in selection_fields.values() for f in fields}
+        data = accident_data[[c for c in sorted(columns) if c in accident_data]]
+        if "LATITUDE" in data and "LONGITUDE" in data:
+            data = snap_coordinates(data, grid)
+        self.data = data
+        self.size = len(data)
+        self.weights = accident_data["n"].to_numpy() if "n" in accident_data else None
+        # built on the first use of each selection
+        self.points = {}
+
+        self.groups = {}
+        self.totals = {}
+        for view, fields in view_fields.items():
+            if not all(f in data for f in fields):
+                continue
+            grouped = data.groupby(fields, observed=True, dropna=False)
+            codes = grouped.ngroup().to_numpy()
+            keys = grouped.size().index.to_frame(index=False)
+            self.groups[view] = (codes, keys)
+            self.totals[view] = self._count(view, None)
+
+        self.map_rows = None
+        if "map" in self.groups:
+            codes, keys = self.groups["map"]
+            order = np.argsort(codes, kind="stable")
+            # the rows of group c are order[starts[c]:starts[c + 1]]
+            starts = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+            self.map_rows = (order, starts)
+
+        self._masks = {}
+        self._rows = None
+        self.max_cubes = cubes
+        # the engine of the cube of each view and set of selections
+        self.cubes = {}
+
+    def _point_mask(self, name, values):
+        if name not in self.points:
+            grouped = self.data.groupby(
+                selection_fields[name], observed=True, dropna=False
+            )
+            self.points[name] = (grouped.ngroup().to_numpy(), grouped.size().index)
+        codes, index = self.points[name]
+        fields = selection_fields[name]
+        if len(fields) == 1:
+            keys = [value.get(fields[0]) for value in values]
+        else:
+            keys = [tuple(value.get(f) for f in fields) for value in values]
+        selected = np.zeros(len(index) + 1, dtype=bool)
+        # values which are not in the data get the position -1, which is the
+        # extra (unselected) entry at the end
+        selected[index.get_indexer(keys)] = True
+        selected[-1] = False
+        return selected[codes]
+
+    def get_rows(self, ids):
+        """
+        Returns the rows of the points of the map under the map brush.
+
+        Parameters:
+        - ids: str or list - The ids of the points, as in the value of the
+          brush ({"_vgsid_": "Set(1,2,3)"}), see get_mask.
+
+        Returns:
+        - rows: array of int - The positions of the accidents, in increasing
+          order.
+        """
+        key = ids if isinstance(ids, str) else json.dumps(ids)
+        if self._rows is not None and self._rows[0] == key:
+            return self._rows[1]
+        if isinstance(ids, str):
+            # the ids are a set, which Vega-Lite serializes as "Set(1,2,3)"
+            ids = re.findall(r"\d+", ids)
+        order, starts = self.map_rows
+        ids = np.array([int(i) for i in ids], dtype=np.int64)
+        # the ids are the codes plus one, and unknown ids select nothing
+        codes = ids[(ids >= 1) & (ids < len(starts))] - 1
+        rows = [order[starts[c] : starts[c + 1]] for c in codes]
+        rows = np.sort(np.concatenate([np.zeros(0, dtype=np.int64)] + rows))
+        self._rows = (key, rows)
+        return rows
+
+    def _interval_mask(self, name, ranges):
+        mask = np.ones(self.size, dtype=bool)
+        for field, (low, high) in ranges.items():
+            values = self.data[field].to_numpy()
+            low, high = min(low, high), max(low, high)
+            mask &= (values >= low) & (values <= high)
+        return mask
+
+    def get_mask(self, name, value):
+        """
+        Returns the rows selected by a selection, or None if it is empty.
+
+        Parameters:
+        - name: str - The name of the selection, see selection_fields.
+        - value: list or dict - The state of the selection: the list of
+          selected points (dicts of field values) of a point selection, the
+          range of each field of an interval selection, or the ids of the
+          points of the map under the map brush ({"_vgsid_": "Set(1,2,3)"}).
+
+        Returns:
+        - mask: array of bool or None - Whether each accident is selected.
+        """
+        fields = selection_fields.get(name)
+        if not value or not fields or not all(f in self.data for f in fields):
+            return None
+        key = json.dumps(value, sort_keys=True, default=str)
+        cached = self._masks.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        if isinstance(value, dict) and "_vgsid_" in value:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[self.get_rows(value["_vgsid_"])] = True
+        elif isinstance(value, dict):
+            ranges = {f: r for f, r in value.items() if f in selection_fields[name]}
+            mask = self._interval_mask(name, ranges)
+        else:
+            mask = self._point_mask(name, value)
+        self._masks[name] = (key, mask)
+        return mask
+
+    def _count(self, view, mask):
+        # the mask is a boolean mask or the positions of the rows
+        codes, keys = self.groups[view]
+        weights = self.weights
+        if mask is not None:
+            codes = codes[mask]
+            weights = None if weights is None else weights[mask]
+        n = np.bincount(codes, weights=weights, minlength=len(keys))
+        counts = keys.assign(n=n.astype(np.int64))
+        if view == "map":
+            # the ids of the points, see get_rows
+            counts["_vgsid_"] = np.arange(1, len(keys) + 1)
+        # groups without accidents are filtered out, as in the browser
+        return counts[counts["n"] > 0].reset_index(drop=True)
+
+    def get_cube(self, view, names):
+        """
+        Returns the engine counting a view from its cube for some selections,
+        see cube.build_cube.
+        """
+        key = (view, tuple(sorted(names)))
+        engine = self.cubes.pop(key, None)
+        if engine is None:
+            engine = CrossFilter(build_cube(self.data, view, key[1]), cubes=0)
+        # the most recently used cubes are the last ones
+        self.cubes[key] = engine
+        while len(self.cubes) > self.max_cubes:
+            del self.cubes[next(iter(self.cubes))]
+        return engine
+
+    def count(self, view, selections):
+        """
+        Counts the accidents of a view filtered by some selections.
+
+        Parameters:
+        - view: str - One of the keys of view_fields.
+        - selections: dict - The state of each selection, by name, see
+          get_mask.
+
+        Returns:
+        - counts: DataFrame - The fields of the view and the number of
+          accidents "n" of each group.
+        """
+        rows = None
+        masks = []
+        for name, value in selections.items():
+            if isinstance(value, dict) and "_vgsid_" in value and self.map_rows:
+                rows = self.get_rows(value["_vgsid_"])
+                continue
+            mask = self.get_mask(name, value)
+            if mask is not None:
+                masks.append(mask)
+        if rows is not None:
+            # only the rows under the map brush are read
+            for mask in masks:
+                rows = rows[mask[rows]]
+            return self._count(view, rows)
+        if not masks:
+            return self.totals[view]
+        mask = masks[0].copy()
+        for other in masks[1:]:
+            mask &= other
+        return self._count(view, mask)
+
+    def query(self, selections=None):
+        """
+        Counts the accidents of each view, filtered by the selections of the
+        other views (see view_filters).
+
+        Parameters:
+        - selections: dict - The state of each selection, by name, as in the
+          "selection" attribute of a Streamlit chart event. Missing and empty
+          selections do not filter.
+
+        Returns:
+        - counts: dict - A DataFrame for each view, with the fields of the view
+          (see view_fields) and the number of accidents "n".
+        """
+        selections = selections or {}
+        selections = {name: value for name, value in selections.items() if value}
+        counts = {}
+        for view, names in view_filters.items():
+            active = {name: selections[name] for name in names if name in selections}
+            if view not in self.groups:
+                continue
+            engine = self
+            # the cubes have no coordinates, see cube.py
+            if active and self.max_cubes and view != "map":
+                if "selection_acc_map" not in active:
+                    engine = self.get_cube(view, active)
+            counts[view] = engine.count(view, active)
+        return counts
+
+    def datasets(self, selections=None):
+        """
+        Returns the counts of each view as the named datasets of the chart
+        built with make_visualization(aggregated="crossfilter").
+        """
+        return {
+            get_dataset_name(view): data
+            for view, data in self.query(selections).items()
+        }
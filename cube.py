@@ -0,0 +1,126 @@
+"""
+Sparse count cubes of the accidents, one for each view of the dashboard and
+set of selections filtering it.
+
+A view counts the accidents grouped by its fields (view_fields), filtered by
+the selections of the other views (view_filters). Its cube for a set of active
+selections holds the number of accidents of each combination of values of the
+fields of the view and of these selections which occurs in the data, so the
+counts of the view under any values of these selections are answered by
+summing cells instead of scanning the accidents. A cube over every dimension
+at once has about as many cells as there are accidents: only the fields of
+one view and of the few selections set at a time make a cube much smaller than
+the data. The coordinates are not part of the cubes: the map and its interval
+selection still need the accidents.
+
+The cubes of the dashboard are built by the cross-filter when a set of
+selections is first used, and kept while it is (see crossfilter.CrossFilter).
+
+Usage (from the repository root), to build a cube and compare a query with a
+scan of the accidents:
+    python cube.py
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from graphs import load_clean_data, selection_fields, view_fields
+
+
+def get_cube_dims(view, names=()):
+    """
+    Returns the fields of the cube of a view: the fields of the view, then the
+    fields of the selections filtering it.
+
+    Parameters:
+    - view: str - One of the keys of view_fields.
+    - names: list - The names of the selections, see selection_fields.
+    """
+    dims = list(view_fields[view])
+    for name in names:
+        dims += [f for f in selection_fields[name] if f not in dims]
+    return dims
+
+
+def build_cube(accident_data, view, names=()):
+    """
+    Counts the accidents of each combination of values of the fields of a view
+    and of some selections.
+
+    Parameters:
+    - accident_data: DataFrame - The cleaned dataset.
+    - view: str - One of the keys of view_fields.
+    - names: list - The names of the selections filtering the view.
+
+    Returns:
+    - cube: DataFrame - One row per combination which occurs in the data, with
+      the fields (see get_cube_dims) and the number of accidents "n".
+    """
+    dims = get_cube_dims(view, names)
+    data = accident_data[dims]
+    for col in data.select_dtypes(include="object").columns:
+        data = data.assign(**{col: data[col].astype("category")})
+    cube = data.groupby(dims, observed=True, dropna=False).size().reset_index(name="n")
+    cube["n"] = pd.to_numeric(cube["n"], downcast="unsigned")
+    return cube
+
+
+def query_cube(cube, groupby, filters=None):
+    """
+    Counts the accidents grouped by some fields of a cube, filtered by the
+    values of others.
+
+    Parameters:
+    - cube: DataFrame - The cube, see build_cube.
+    - groupby: list - Fields to group by. Empty for the total count.
+    - filters: dict, optional - For each field, the list of selected values,
+      or a (low, high) tuple for an inclusive range.
+
+    Returns:
+    - counts: DataFrame - The groups with at least one accident, and their
+      number of accidents "n".
+    """
+    if filters:
+        mask = np.ones(len(cube), dtype=bool)
+        for dim, values in filters.items():
+            if isinstance(values, tuple):
+                mask &= cube[dim].between(*values).to_numpy()
+            else:
+                mask &= cube[dim].isin(values).to_numpy()
+        cube = cube[mask]
+    if not groupby:
+        return pd.DataFrame({"n": [int(cube["n"].sum())]})
+    counts = (
+        cube.groupby(groupby, observed=True, dropna=False)["n"].sum().reset_index()
+    )
+    return counts[counts["n"] > 0].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    accident_data = load_clean_data("clean_data.csv")
+    names = ["selection_buro", "time_brush"]
+    start = time.perf_counter()
+    cube = build_cube(accident_data, "weather", names)
+    print(
+        f"cube of the weather view under {', '.join(names)}: {len(cube):,} "
+        f"cells for {len(accident_data):,} accidents, built in "
+        f"{time.perf_counter() - start:.3f} s"
+    )
+
+    filters = {"name": ["Brooklyn", "Queens"], "HOUR": (7, 9)}
+    start = time.perf_counter()
+    counts = query_cube(cube, ["conditions"], filters)
+    cube_time = time.perf_counter() - start
+    start = time.perf_counter()
+    selected = accident_data[
+        accident_data["name"].isin(filters["name"])
+        & accident_data["HOUR"].between(*filters["HOUR"])
+    ]
+    expected = selected.groupby("conditions", observed=True).size()
+    scan_time = time.perf_counter() - start
+    assert counts.set_index("conditions")["n"].sum() == expected.sum()
+    print(
+        f"query: {cube_time * 1000:.1f} ms on the cube, "
+        f"{scan_time * 1000:.1f} ms scanning the accidents"
+    )
@@ -0,0 +1,280 @@
+"""
+Batch export of the visualization as static HTML pages, one for each subset
+of the accidents (variant), such as the accidents of a borough, of a month or
+of a vehicle type.
+
+The chart is built once, with all the accidents. Each of its datasets is
+written to its own JSON file, named by its content, and every page loads them
+by URL instead of inlining them: all the variants share the same data files,
+which the browser downloads (and caches) once. A variant is the chart with a
+filter transform on the views of the accidents. The pages must therefore be
+served over HTTP, next to their data directory.
+
+The hash of the spec of each page is kept in a manifest, so that the pages
+whose spec has not changed are not written again. The others are rendered by
+a pool of worker processes.
+
+The pages keep the vega-embed options of the rendering profile in their spec
+(see graphs.render_profiles), e.g. --render large for the canvas renderer
+without hover processing.
+
+Usage (from the repository root):
+    python export.py [--by name monthname "VEHICLE TYPE CODE 1"] [--out export]
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import re
+
+import altair as alt
+from altair.utils.html import spec_to_html
+
+from graphs import (
+    link_datasets,
+    load_clean_data,
+    make_visualization,
+    render_profiles,
+    vis_cols,
+    write_dataset,
+)
+
+# Columns whose values define the variants, by default
+variant_cols = ["name", "monthname", "VEHICLE TYPE CODE 1"]
+
+# Directory of the data files, relative to the pages
+data_dir = "data"
+
+# File, in the output directory, with the spec hash of each exported page
+manifest_name = "manifest.json"
+
+# Names which Altair gives to the views and parameters without one, from a
+# counter which keeps growing with every chart converted in the process
+auto_name = re.compile(r"\b(view|param)_\d+\b")
+
+
+def get_variants(accident_data, columns=variant_cols):
+    """
+    Lists the variants with the accidents of each value of some columns, and
+    the variant with all the accidents.
+
+    Parameters:
+    - accident_data: DataFrame - The cleaned dataset.
+    - columns: list - The columns whose values define the variants.
+
+    Returns:
+    - variants: dict - The values selected by each variant, by column, by file
+      name of the page ("all.html" selects every accident).
+    """
+    variants = {"all.html": {}}
+    for col in columns:
+        for value in sorted(accident_data[col].dropna().unique().tolist()):
+            slug = re.sub(r"[^a-z0-9]+", "-", f"{col}-{value}".lower()).strip("-")
+            variants[f"{slug}.html"] = {col: [value]}
+    return variants
+
+
+def write_datasets(spec, out):
+    """
+    Moves the datasets of a spec to data files, which are kept if they
+    already exist: their names are the hash of their content, as with the
+    static data of the dashboard (see graphs.to_static_urls).
+
+    Parameters:
+    - spec: dict - The Vega-Lite spec, which is modified in place.
+    - out: str - The output directory.
+
+    Returns:
+    - datasets: dict - The values of each dataset which was moved, by URL.
+    """
+    datasets = spec.pop("datasets", {})
+    urls = {}
+    for name, values in datasets.items():
+        file_name, _ = write_dataset(values, os.path.join(out, data_dir))
+        urls[name] = f"{data_dir}/{file_name}"
+    link_datasets(spec, {name: {"url": url} for name, url in urls.items()})
+    return {urls[name]: values for name, values in datasets.items()}
+
+
+def filter_spec(spec, urls, filters):
+    """
+    Returns a copy of a spec in which the views of some datasets only show
+    the records with the given values.
+
+    Parameters:
+    - spec: dict - The Vega-Lite spec, with its data linked to data files.
+    - urls: set - The URLs of the data files to filter.
+    - filters: dict - The values to keep, by field.
+
+    Returns:
+    - spec: dict - The filtered spec.
+    """
+    spec = copy.deepcopy(spec)
+    transform = [
+        {"filter": {"field": field, "oneOf": values}}
+        for field, values in filters.items()
+    ]
+    if transform:
+        _filter_units(spec, None, urls, transform)
+    return spec
+
+
+def _filter_units(spec, data, urls, transform):
+    """
+    Prepends a transform to the unit views of a spec which draw one of the
+    data files, including the views which inherit their data.
+    """
+    data = spec.get("data", data)
+    if "mark" in spec:
+        if isinstance(data, dict) and data.get("url") in urls:
+            spec["transform"] = transform + spec.get("transform", [])
+        return
+    for key in ["layer", "hconcat", "vconcat", "concat"]:
+        for child in spec.get(key, []):
+            _filter_units(child, data, urls, transform)
+    if isinstance(spec.get("spec"), dict):
+        _filter_units(spec["spec"], data, urls, transform)
+
+
+def canonicalize_names(spec):
+    """
+    Returns a copy of a spec in which the names generated by Altair for its
+    views and parameters are numbered in their order in the spec, so that the
+    same chart gets the same spec however many charts were built before it.
+    """
+    names = {}
+
+    def rename(match):
+        if match.group(0) not in names:
+            kind = match.group(1)
+            number = sum(name.startswith(kind) for name in names) + 1
+            names[match.group(0)] = f"{kind}_{number}"
+        return names[match.group(0)]
+
+    return json.loads(auto_name.sub(rename, json.dumps(spec)))
+
+
+def get_spec_hash(spec):
+    """
+    Returns the hash of a spec, which identifies the page rendering it.
+    """
+    content = json.dumps(
+        [
+            canonicalize_names(spec),
+            alt.VEGA_VERSION,
+            alt.VEGALITE_VERSION,
+            alt.VEGAEMBED_VERSION,
+        ],
+        sort_keys=True,
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def write_page(args):
+    """
+    Renders a spec as a standalone HTML page, in a worker process of
+    export_variants.
+    """
+    spec, path = args
+    page = spec_to_html(
+        spec,
+        mode="vega-lite",
+        vega_version=alt.VEGA_VERSION,
+        vegalite_version=alt.VEGALITE_VERSION,
+        vegaembed_version=alt.VEGAEMBED_VERSION,
+    )
+    with open(path, "w") as f:
+        f.write(page)
+    return path
+
+
+def export_variants(
+    accident_data, out="export", variants=None, processes=None, render="default"
+):
+    """
+    Exports the visualization of each variant as a static HTML page, sharing
+    the data files. The pages whose spec has not changed since the last
+    export are skipped.
+
+    Parameters:
+    - accident_data: DataFrame - The cleaned dataset.
+    - out: str - The output directory.
+    - variants: dict, optional - The values selected by each variant, by file
+      name of the page, see get_variants. Defaults to the variants of
+      variant_cols.
+    - processes: int, optional - Number of worker processes. Defaults to the
+      number of cores; with 1 the pages are rendered in this process.
+    - render: str or dict - The rendering profile of the pages, see
+      graphs.render_profiles.
+
+    Returns:
+    - written: list - The pages which were written.
+    - skipped: list - The pages which were up to date.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if variants is None:
+        variants = get_variants(accident_data)
+    spec = make_visualization(accident_data, render=render).to_dict()
+    datasets = write_datasets(spec, out)
+    spec = canonicalize_names(spec)
+    # the views of the accidents are the ones which draw records with the
+    # filtered fields (not the borough shapes)
+    fields = {field for filters in variants.values() for field in filters}
+    urls = {
+        url
+        for url, values in datasets.items()
+        if isinstance(values, list) and values and fields <= set(values[0])
+    }
+
+    manifest_path = os.path.join(out, manifest_name)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    pending = []
+    skipped = []
+    hashes = {}
+    for page, filters in variants.items():
+        variant = filter_spec(spec, urls, filters)
+        hashes[page] = get_spec_hash(variant)
+        path = os.path.join(out, page)
+        if manifest.get(page) == hashes[page] and os.path.exists(path):
+            skipped.append(page)
+        else:
+            pending.append((variant, path))
+
+    processes = processes or os.cpu_count()
+    if processes == 1 or len(pending) <= 1:
+        written = [write_page(args) for args in pending]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            written = list(pool.map(write_page, pending))
+
+    manifest.update(hashes)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return [os.path.basename(path) for path in written], skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--data", default="clean_data.csv")
+    parser.add_argument("--by", nargs="+", default=variant_cols)
+    parser.add_argument("--out", default="export")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--render", default="default", choices=render_profiles)
+    args = parser.parse_args()
+
+    accident_data = load_clean_data(args.data, columns=vis_cols)
+    written, skipped = export_variants(
+        accident_data,
+        args.out,
+        get_variants(accident_data, args.by),
+        processes=args.processes,
+        render=args.render,
+    )
+    print(f"{len(written)} pages written, {len(skipped)} up to date in {args.out}")
@@ -1,7 +1,20 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+
 import altair as alt
+import numpy as np
 import pandas as pd
-import geopandas as gpd
-from geodatasets import get_path
+
+from borough_shapes import get_shapes_data
+from weather import WeatherLookup
+
+# The geospatial stack (geopandas, geodatasets, shapely, pyproj) and the
+# process pool are only needed to preprocess the raw data, so they are
+# imported by the functions which use them: the dashboard only loads the
+# cleaned dataset and should not pay for them at startup.
 
 # we disable max_rows in altair
 alt.data_transformers.disable_max_rows()
@@ -41,6 +54,326 @@ filter_cols = [
     "num_days_in_month",
 ]
 
+# Columns of the cleaned dataset used by the visualization. Only these are
+# read from the columnar cache when serving the app.
+vis_cols = [
+    "CRASH DATE",
+    "LATITUDE",
+    "LONGITUDE",
+    "date",
+    "HOUR",
+    "week",
+    "weekday",
+    "month",
+    "name",
+    "VEHICLE TYPE CODE 1",
+    "CONTRIBUTING FACTOR VEHICLE 1",
+    "dayname",
+    "monthname",
+    "conditions",
+    "fulldate",
+    "INJURED",
+    "num_days_in_month",
+]
+
+
+# Fields encoded by each view of the visualization, by which its counts are
+# grouped when the data is pre-aggregated
+view_fields = {
+    "map": ["name", "LATITUDE", "LONGITUDE"],
+    "density": ["cell", "name"],
+    "borough": ["name"],
+    "vehicle": ["VEHICLE TYPE CODE 1"],
+    "weather": ["conditions"],
+    "calendar": ["monthname", "dayname", "week", "fulldate"],
+    "counts": ["INJURED"],
+    "total": ["INJURED"],
+    "month": ["monthname", "num_days_in_month"],
+    "time_of_day": ["HOUR", "dayname"],
+    "factor": ["CONTRIBUTING FACTOR VEHICLE 1"],
+}
+
+# Data fields of each selection of the visualization, by parameter name
+selection_fields = {
+    "selection_buro": ["name"],
+    "selection_acc_map": ["LATITUDE", "LONGITUDE"],
+    "selection_cond": ["conditions"],
+    "selection_month": ["monthname"],
+    "selection_weekday": ["dayname"],
+    "selection_vehicle": ["VEHICLE TYPE CODE 1"],
+    "time_brush": ["HOUR"],
+    "selection_injured": ["INJURED"],
+    "selection_acc_factor": ["CONTRIBUTING FACTOR VEHICLE 1"],
+    "selection_week": ["week"],
+}
+
+# Selections filtering the data of each view, as in the main layer of its
+# chart. A view is not filtered by its own selections, which only highlight.
+view_filters = {
+    "map": [
+        "selection_cond",
+        "selection_month",
+        "selection_weekday",
+        "selection_vehicle",
+        "time_brush",
+        "selection_injured",
+        "selection_acc_factor",
+        "selection_week",
+    ],
+    "density": [
+        "selection_cond",
+        "selection_month",
+        "selection_weekday",
+        "selection_vehicle",
+        "time_brush",
+        "selection_injured",
+        "selection_acc_factor",
+        "selection_week",
+    ],
+    "borough": [
+        "selection_cond",
+        "selection_month",
+        "selection_weekday",
+        "selection_vehicle",
+        "time_brush",
+        "selection_injured",
+        "selection_acc_map",
+        "selection_acc_factor",
+        "selection_week",
+    ],
+    "vehicle": [
+        "selection_buro",
+        "selection_month",
+        "selection_weekday",
+        "selection_cond",
+        "time_brush",
+        "selection_injured",
+        "selection_acc_map",
+        "selection_acc_factor",
+        "selection_week",
+    ],
+    "weather": [
+        "selection_acc_map",
+        "selection_month",
+        "selection_weekday",
+        "selection_vehicle",
+        "time_brush",
+        "selection_injured",
+        "selection_acc_factor",
+        "selection_buro",
+        "selection_week",
+    ],
+    "calendar": [
+        "selection_acc_map",
+        "selection_cond",
+        "selection_month",
+        "selection_vehicle",
+        "time_brush",
+        "selection_injured",
+        "selection_acc_factor",
+        "selection_buro",
+    ],
+    "counts": [
+        "selection_acc_map",
+        "selection_buro",
+        "selection_cond",
+        "selection_month",
+        "selection_weekday",
+        "selection_vehicle",
+        "time_brush",
+        "selection_acc_factor",
+        "selection_week",
+    ],
+    # the total number of accidents, which no selection filters
+    "total": [],
+    "month": [
+        "selection_acc_map",
+        "selection_cond",
+        "selection_weekday",
+        "selection_vehicle",
+        "time_brush",
+        "selection_injured",
+        "selection_acc_factor",
+    ],
+    "time_of_day": [
+        "selection_cond",
+        "selection_buro",
+        "selection_vehicle",
+        "selection_acc_map",
+        "selection_acc_factor",
+        "selection_month",
+        "selection_injured",
+        "selection_week",
+    ],
+    "factor": [
+        "selection_buro",
+        "selection_acc_map",
+        "selection_cond",
+        "selection_month",
+        "selection_weekday",
+        "selection_vehicle",
+        "time_brush",
+        "selection_injured",
+        "selection_week",
+    ],
+}
+
+# Columns of the raw dataset used by the preprocessing, for reading only them
+raw_cols = [
+    "CRASH DATE",
+    "CRASH TIME",
+    "LATITUDE",
+    "LONGITUDE",
+    "NUMBER OF PERSONS INJURED",
+    "NUMBER OF PEDESTRIANS INJURED",
+    "NUMBER OF CYCLIST INJURED",
+    "NUMBER OF MOTORIST INJURED",
+    "CONTRIBUTING FACTOR VEHICLE 1",
+    "COLLISION_ID",
+    "VEHICLE TYPE CODE 1",
+]
+
+# Integer columns of the cleaned data which never have missing values, kept as
+# integers in the store of ingest_accident_data
+store_int_cols = [
+    "COLLISION_ID",
+    "HOUR",
+    "weekday",
+    "week",
+    "month",
+    "num_days_in_month",
+    "index_left",
+]
+
+# Formats of the CRASH DATE and CRASH TIME columns of the raw dataset
+crash_date_format = "%Y-%m-%dT%H:%M:%SZ"
+crash_time_format = "%H:%M"
+
+# Names of the vehicle types we keep, indexed by their title-cased raw value
+vehicle_names = {"Fire Truck": "FIRE", "Ambulance": "AMBULANCE", "Taxi": "TAXI"}
+
+# Shorter, more readable names for the contributing factors
+factor_names = {
+    "Passing Too Closely": "Traffic Violation - Passing Too Closely",
+    "Driver Inattention/Distraction": "Driver Distraction",
+    "Unspecified": "Unclear Reason",
+    "Following Too Closely": "Tailgating",
+    "Turning Improperly": "Improper Turning",
+    "Unsafe Lane Changing": "Unsafe Lane Change",
+    "Pedestrian/Bicyclist/Other Pedestrian Error/Confusion": "Pedestrian/Bicyclist Error/Confusion",
+    "Driver Inexperience": "Inexperienced Driver",
+    "Reaction to Uninvolved Vehicle": "Reaction to Other Vehicle",
+    "Aggressive Driving/Road Rage": "Aggressive Driving/Road Rage",
+    "Passing or Lane Usage Improper": "Improper Passing/Lane Usage",
+    "Other Vehicular": "Other Vehicle Related",
+    "Traffic Control Disregarded": "Disregarded Traffic Control",
+    "Failure to Yield Right-of-Way": "Failure to Yield",
+    "Unsafe Speed": "Excessive Speed",
+    "Fell Asleep": "Drowsy Driving",
+    "Passenger Distraction": "Passenger Distraction",
+    "Oversized Vehicle": "Oversized Vehicle",
+    "Backing Unsafely": "Unsafe Backing",
+    "Failure to Keep Right": "Failure to Keep Right",
+    "Outside Car Distraction": "External Distraction",
+    "Tire Failure/Inadequate": "Tire Failure/Inadequate",
+    "View Obstructed/Limited": "Limited Visibility",
+    "Glare": "Glare Effect",
+    "Alcohol Involvement": "Alcohol Impairment",
+    "Obstruction/Debris": "Road Obstruction/Debris",
+    "Pavement Slippery": "Slippery Pavement",
+    "Brakes Defective": "Defective Brakes",
+    "Cell Phone (hand-Held)": "Cell Phone Usage",
+    "Drugs (illegal)": "Illegal Drug Usage",
+    "Driverless/Runaway Vehicle": "Runaway Vehicle",
+    "Steering Failure": "Steering Failure",
+    "Accelerator Defective": "Defective Accelerator",
+    "Pavement Defective": "Defective Pavement",
+    "Fatigued/Drowsy": "Driver Fatigue",
+    "Other Lighting Defects": "Lighting Defects",
+    "Vehicle Vandalism": "Malicious Damage",
+}
+
+# Orders of the days of the week and months, as in the charts
+day_names = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+month_names = [
+    "January",
+    "February",
+    "March",
+    "April",
+    "May",
+    "June",
+    "July",
+    "August",
+    "September",
+    "October",
+    "November",
+    "December",
+]
+
+borough_names = ["Bronx", "Brooklyn", "Manhattan", "Queens", "Staten Island"]
+
+# Text columns of the cleaned dataset stored as categoricals, with their fixed
+# categories. Values outside of them (new contributing factors, weather
+# conditions, ...) are added after them, see set_categories.
+category_values = {
+    "BOROUGH": [b.upper() for b in borough_names],
+    "name": borough_names,
+    "VEHICLE TYPE CODE 1": sorted(vehicle_names.values()),
+    "CONTRIBUTING FACTOR VEHICLE 1": sorted(set(factor_names.values())),
+    "dayname": day_names,
+    "monthname": month_names,
+    "conditions": [],
+    "INJURED": ["with injuries", "without injuries"],
+    "fulldate": [],
+}
+
+# Categorical columns whose categories are in chronological order
+ordered_cols = ["dayname", "monthname", "fulldate"]
+
+# Size of the cells of the density map at each resolution the user can choose,
+# in degrees of latitude (the distance between the centers of neighbouring
+# cells)
+map_resolutions = {"coarse": 0.02, "medium": 0.01, "fine": 0.005}
+
+# Latitude at which the density cells are regular: a degree of longitude is
+# shorter than a degree of latitude by its cosine
+map_latitude = 40.7
+
+# Rendering profiles of the visualization (see make_visualization):
+# - embed: vega-embed options (renderer, hover, tooltip), kept in the spec so
+#   that Streamlit and the exported pages use them
+# - dense_tooltips: whether the layers with many marks (the points of the map
+#   and the calendar) have tooltips. Without, Vega does not search their marks
+#   on pointer moves, unless they hold a selection.
+# - throttle: minimum time in ms between two updates of the map brush while it
+#   is dragged, or None
+render_profiles = {
+    "default": {"embed": {}, "dense_tooltips": True, "throttle": None},
+    "svg": {"embed": {"renderer": "svg"}, "dense_tooltips": True, "throttle": None},
+    "large": {
+        "embed": {"renderer": "canvas", "hover": False},
+        "dense_tooltips": False,
+        "throttle": 50,
+    },
+}
+
+# Number of accidents from which the dashboard uses the "large" profile
+large_data_rows = 100_000
+
+# Directory of the dataset files written by to_static_urls, and
+# the URL Streamlit serves it at when server.enableStaticServing is set (see
+# .streamlit/config.toml)
+static_data_dir = os.path.join("static", "data")
+static_data_url = "app/static/data"
+
 
 def get_map():
     """
@@ -49,19 +382,30 @@ def get_map():
     Returns:
         GeoDataFrame: A map of New York City, with buroughs divisions.
     """
+    import geopandas as gpd
+    from geodatasets import get_path
+
     path = get_path("nybb")
     ny = gpd.read_file(path).to_crs("EPSG:4326")
     return ny
 
 
-def get_buroughs():
+def get_buroughs(path=None):
     """
     Get the boroughs from ny map.
 
+    Parameters:
+    - path: str, optional - File with the borough polygons. Defaults to the
+      nybb dataset of geodatasets.
+
     Returns:
     - buroughs: Buroughs geodataframe.
     """
-    path = get_path("nybb")
+    import geopandas as gpd
+    from geodatasets import get_path
+
+    if path is None:
+        path = get_path("nybb")
     buroughs = gpd.read_file(path).to_crs("EPSG:4326")
 
     return buroughs.reset_index()
@@ -78,171 +422,958 @@ def get_accident_data(fname, sample=False):
     Returns:
     pandas.DataFrame: The preprocessed accident data.
     """
-    df = pd.read_csv(fname)
+    return clean_accident_data(pd.read_csv(fname), sample=sample)
+
+
+def clean_accident_data(df, sample=False, boroughs=None):
+    """
+    Preprocesses raw accident records: parses the dates, keeps the accidents
+    of the studied period and vehicles, derives the calendar and injury
+    columns and assigns the boroughs.
+
+    Parameters:
+    - df: DataFrame - Raw accident records, with the columns of the CSV file.
+    - sample: bool - Whether to sample the data.
+    - boroughs: str, optional - File with the borough polygons, see
+      get_buroughs.
 
-    # Parse the date column as a date
-    df["date"] = pd.to_datetime(df["CRASH DATE"])  # , format="%Y-%m-%d")
-    # filter year 2018 only
-    df = df[df["date"].dt.year == 2018]
-    # filter june, july, august
-    df = df[df["date"].dt.month.isin([6, 7, 8, 9])]
+    Returns:
+    - df: DataFrame - The preprocessed accident data.
+    """
+    # Parse the crash date and time
+    df = parse_crash_datetime(df)
+    df = filter_accident_dates(df)
     if sample:
         df = df.sample(1000)
 
-    df["VEHICLE TYPE CODE 1"] = df["VEHICLE TYPE CODE 1"].str.title()
+    df = derive_accident_columns(df)
 
-    # filter types of vehicles
-    df["VEHICLE TYPE CODE 1"] = df["VEHICLE TYPE CODE 1"].replace(
-        ["Fire Truck"], "FIRE"
-    )
-    df["VEHICLE TYPE CODE 1"] = df["VEHICLE TYPE CODE 1"].replace(
-        ["Ambulance"], "AMBULANCE"
-    )
-    df["VEHICLE TYPE CODE 1"] = df["VEHICLE TYPE CODE 1"].replace(["Taxi"], "TAXI")
-    df = df[df["VEHICLE TYPE CODE 1"].isin(["FIRE", "AMBULANCE", "TAXI"])]
-
-    # create HOUR column from CRASH TIME
-    df["CRASH TIME"] = pd.to_datetime(df["CRASH TIME"])
-    df["HOUR"] = df["CRASH TIME"].dt.hour
-
-    df["weekday"] = df["date"].dt.weekday
-    df["weekday_name"] = df["date"].dt.day
-    # make weekend column
-    df["weekend"] = df["weekday"].apply(lambda x: 1 if x > 4 else 0)
-
-    df["week"] = df["date"].dt.isocalendar().week
-    df["month"] = df["date"].dt.month
-
-    # for each month we get the minimum week number, to get the
-    # week number within the month
-    # min_week = df.groupby(["month"])["week"].min().reset_index()
-
-    # df = pd.merge(df, min_week, on="month", how="left")
-    # df["week"] = df["week_x"] - df["week_y"] + 1
-
-    replacement_dict = {
-        "Passing Too Closely": "Traffic Violation - Passing Too Closely",
-        "Driver Inattention/Distraction": "Driver Distraction",
-        "Unspecified": "Unclear Reason",
-        "Following Too Closely": "Tailgating",
-        "Turning Improperly": "Improper Turning",
-        "Unsafe Lane Changing": "Unsafe Lane Change",
-        "Pedestrian/Bicyclist/Other Pedestrian Error/Confusion": "Pedestrian/Bicyclist Error/Confusion",
-        "Driver Inexperience": "Inexperienced Driver",
-        "Reaction to Uninvolved Vehicle": "Reaction to Other Vehicle",
-        "Aggressive Driving/Road Rage": "Aggressive Driving/Road Rage",
-        "Passing or Lane Usage Improper": "Improper Passing/Lane Usage",
-        "Other Vehicular": "Other Vehicle Related",
-        "Traffic Control Disregarded": "Disregarded Traffic Control",
-        "Failure to Yield Right-of-Way": "Failure to Yield",
-        "Unsafe Speed": "Excessive Speed",
-        "Fell Asleep": "Drowsy Driving",
-        "Passenger Distraction": "Passenger Distraction",
-        "Oversized Vehicle": "Oversized Vehicle",
-        "Backing Unsafely": "Unsafe Backing",
-        "Failure to Keep Right": "Failure to Keep Right",
-        "Outside Car Distraction": "External Distraction",
-        "Tire Failure/Inadequate": "Tire Failure/Inadequate",
-        "View Obstructed/Limited": "Limited Visibility",
-        "Glare": "Glare Effect",
-        "Alcohol Involvement": "Alcohol Impairment",
-        "Obstruction/Debris": "Road Obstruction/Debris",
-        "Pavement Slippery": "Slippery Pavement",
-        "Brakes Defective": "Defective Brakes",
-        "Cell Phone (hand-Held)": "Cell Phone Usage",
-        "Drugs (illegal)": "Illegal Drug Usage",
-        "Driverless/Runaway Vehicle": "Runaway Vehicle",
-        "Steering Failure": "Steering Failure",
-        "Accelerator Defective": "Defective Accelerator",
-        "Pavement Defective": "Defective Pavement",
-        "Fatigued/Drowsy": "Driver Fatigue",
-        "Other Lighting Defects": "Lighting Defects",
-        "Vehicle Vandalism": "Malicious Damage",
-    }
+    # Given that a lot of null values are present in burough, we
+    # use the coordinates to get the burough
+    df = df.dropna(subset=["LATITUDE", "LONGITUDE"])
+    df = assign_boroughs(df, boroughs)
 
-    df["CONTRIBUTING FACTOR VEHICLE 1"] = df["CONTRIBUTING FACTOR VEHICLE 1"].replace(
-        replacement_dict
-    )
+    # make column month_number- week_number
+    df["month-week"] = df["month"].astype(str) + "-" + df["week"].astype(str)
 
-    df["dayname"] = df["date"].dt.day_name()
-    df["monthname"] = df["date"].dt.month_name()
-    df["num_days_in_month"] = df["monthname"].apply(
-        lambda x: 30 if x in ["June", "September"] else 31
-    )
+    return set_categories(df)
 
-    df["fulldate"] = (
-        df["monthname"] + " " + df["date"].dt.day.astype(str) + ", " + df["dayname"]
-    )
 
-    df["INJURED"] = (
+def filter_accident_dates(df, year=2018, months=(6, 7, 8, 9)):
+    """
+    Keeps the accidents of the months of the summer of a year.
+
+    Parameters:
+    - df: DataFrame - Accident data with the parsed "date" column.
+    - year: int - The year to keep.
+    - months: tuple - The months to keep.
+
+    Returns:
+    - df: DataFrame - The accidents of the given months.
+    """
+    return df[(df["date"].dt.year == year) & df["date"].dt.month.isin(months)]
+
+
+@lru_cache(maxsize=None)
+def get_borough_lookup(path=None):
+    """
+    Loads the borough polygons and builds their spatial index. This is done
+    only once per process.
+
+    Parameters:
+    - path: str, optional - File with the borough polygons, see get_buroughs.
+
+    Returns:
+    - buroughs: DataFrame - Attributes of the boroughs (without geometry).
+    - lookup: BoroughLookup - Index assigning points to the boroughs.
+    """
+    from boroughs import BoroughLookup
+
+    buroughs = get_buroughs(path)
+    lookup = BoroughLookup(buroughs.geometry.to_numpy())
+    return pd.DataFrame(buroughs.drop(columns="geometry")), lookup
+
+
+def assign_boroughs(df, path=None):
+    """
+    Assigns each accident to the borough containing its coordinates, adding
+    the borough attributes ("name", "BoroCode", ...). Accidents outside all
+    the boroughs are dropped.
+
+    Parameters:
+    - df: DataFrame - Accident data with LATITUDE and LONGITUDE columns.
+    - path: str, optional - File with the borough polygons, see get_buroughs.
+
+    Returns:
+    - df: DataFrame - The accidents inside a borough with its attributes.
+    """
+    buroughs, lookup = get_borough_lookup(path)
+    idx = lookup.lookup(df["LONGITUDE"].to_numpy(), df["LATITUDE"].to_numpy())
+    df = df[idx >= 0].reset_index(names="index_left")
+    attributes = buroughs.iloc[idx[idx >= 0]].reset_index(drop=True)
+    attributes = attributes.rename(columns={"BoroName": "name"})
+    return pd.concat([df, attributes], axis=1)
+
+
+def _fulldate_key(value):
+    """
+    Sorting key of a fulldate ("June 1, Friday"): its day of the year.
+    """
+    return pd.to_datetime(value.split(",")[0] + " 2000", format="%B %d %Y")
+
+
+def set_categories(df):
+    """
+    Converts the text columns of category_values to categoricals, in place.
+    The categories are the fixed ones of the column followed by the other
+    values found, sorted (chronologically for fulldate), so that no value is
+    lost. Only the fixed categories are the same whatever the data: the
+    others, such as all the weather conditions and dates, depend on the values
+    in df, so two datasets with different values get different categories and
+    codes for them.
+
+    Parameters:
+    - df: DataFrame - Accident data, with any of the columns.
+
+    Returns:
+    - df: DataFrame - The same DataFrame.
+    """
+    for col, fixed in category_values.items():
+        if col not in df.columns:
+            continue
+        known = set(fixed)
+        extra = [v for v in df[col].dropna().unique() if v not in known]
+        extra = sorted(extra, key=_fulldate_key if col == "fulldate" else None)
+        dtype = pd.CategoricalDtype(list(fixed) + extra, ordered=col in ordered_cols)
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def parse_cached(values, format):
+    """
+    Parses a column of date or time strings with a fixed format. Each distinct
+    string is parsed only once and the result is broadcast back to the rows.
+    If some value does not match the format, the distinct values are parsed
+    inferring the format instead.
+
+    Parameters:
+    - values: Series - The strings to parse.
+    - format: str - The strptime format of the strings.
+
+    Returns:
+    - parsed: Series - The parsed datetimes, with the index of values.
+    """
+    codes, uniques = pd.factorize(values)
+    try:
+        parsed = pd.to_datetime(uniques, format=format)
+    except ValueError:
+        parsed = pd.to_datetime(uniques, format="mixed")
+    # codes of missing values are -1, which take the NaT appended at the end
+    parsed = parsed.tz_localize(None).append(pd.DatetimeIndex([pd.NaT]))
+    return pd.Series(parsed.to_numpy()[codes], index=values.index)
+
+
+def parse_crash_datetime(df):
+    """
+    Parses the CRASH DATE and CRASH TIME columns once, adding the crash day
+    ("date"), the hour of the crash ("HOUR") and the full crash timestamp
+    ("crash_datetime").
+
+    Parameters:
+    - df: DataFrame - Raw accident data.
+
+    Returns:
+    - df: DataFrame - The accident data with the parsed columns.
+    """
+    date = parse_cached(df["CRASH DATE"], crash_date_format).dt.normalize()
+    time = parse_cached(df["CRASH TIME"], crash_time_format)
+    df["date"] = date
+    df["HOUR"] = time.dt.hour
+    df["crash_datetime"] = date + (time - time.dt.normalize())
+    return df
+
+
+def derive_accident_columns(df):
+    """
+    Filters the vehicle types and derives the columns used by the charts
+    (calendar fields, contributing factor names and injuries). All the
+    derivations are vectorized; the calendar fields are computed once per
+    distinct date and broadcast back to the rows.
+
+    Parameters:
+    - df: DataFrame - Accident data with the parsed "date" and "HOUR" columns.
+
+    Returns:
+    - df: DataFrame - The filtered accident data with the derived columns.
+    """
+    # title-case each distinct raw value once and map it to the kept name, so
+    # that renaming and filtering the vehicle types is a single pass
+    vehicles = df["VEHICLE TYPE CODE 1"]
+    mapping = {v: vehicle_names.get(v.title()) for v in vehicles.dropna().unique()}
+    vehicles = vehicles.map(mapping)
+    df = df[vehicles.notna()].copy()
+    df["VEHICLE TYPE CODE 1"] = vehicles[vehicles.notna()]
+
+    codes, days = pd.factorize(df["date"])
+    days = pd.DatetimeIndex(days)
+    calendar = pd.DataFrame(
+        {
+            "weekday": days.weekday,
+            "weekday_name": days.day,
+            "weekend": np.where(days.weekday > 4, 1, 0),
+            "week": days.isocalendar().week.to_numpy(),
+            "month": days.month,
+            "dayname": days.day_name(),
+            "monthname": days.month_name(),
+            "num_days_in_month": days.days_in_month,
+        }
+    )
+    calendar["fulldate"] = (
+        calendar["monthname"]
+        + " "
+        + calendar["weekday_name"].astype(str)
+        + ", "
+        + calendar["dayname"]
+    )
+    for col in calendar.columns:
+        if calendar[col].dtype == object:
+            # text is broadcast as a categorical, one byte per row
+            df[col] = pd.Categorical(calendar[col])[codes]
+        else:
+            df[col] = calendar[col].to_numpy()[codes]
+
+    # rename the contributing factors in a single pass as well
+    factors = df["CONTRIBUTING FACTOR VEHICLE 1"]
+    mapping = {f: factor_names.get(f, f) for f in factors.dropna().unique()}
+    df["CONTRIBUTING FACTOR VEHICLE 1"] = factors.map(mapping)
+
+    injured = (
         df["NUMBER OF PEDESTRIANS INJURED"]
         + df["NUMBER OF CYCLIST INJURED"]
         + df["NUMBER OF MOTORIST INJURED"]
         + df["NUMBER OF PERSONS INJURED"]
     )
-    # We assign 0 if = 0 and 1 if >0
-    df["INJURED"] = df["INJURED"].apply(
-        lambda x: "with injuries" if x > 0 else "without injuries"
-    )
+    df["INJURED"] = np.where(injured > 0, "with injuries", "without injuries")
 
-    # Given that a lot of null values are present in burough, we
-    # use the coordinates to get the burough
+    return df
 
-    burough_map = get_buroughs()
-    df = df.dropna(subset=["LATITUDE", "LONGITUDE"])
-    gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df.LONGITUDE, df.LATITUDE))
-    gdf = gdf.set_crs(epsg=4326, inplace=False)
-
-    gdf = gpd.sjoin(gdf, burough_map, how="right", op="intersects")
-    # convert to dataframe
-    gdf = pd.DataFrame(gdf)
-    gdf = gdf.rename(columns={"BoroName": "name"})
 
-    # make column month_number- week_number
-    gdf["month-week"] = gdf["month"].astype(str) + "-" + gdf["week"].astype(str)
+@lru_cache(maxsize=None)
+def get_weather_lookup(fname="weather2018.csv"):
+    """
+    Loads the weather observations and indexes them by time. This is done
+    only once per process.
 
-    # drop geometry
-    gdf = gdf.drop(columns=["geometry"])
+    Parameters:
+    - fname: str - Path to the weather CSV file, with daily or hourly
+      observations in its "datetime" column.
 
-    return gdf
+    Returns:
+    - weather: DataFrame - The weather observations, with parsed times.
+    - lookup: WeatherLookup - Index matching times to the observations.
+    """
+    weather = pd.read_csv(fname)
+    weather["datetime"] = pd.to_datetime(weather["datetime"], format="ISO8601")
+    return weather, WeatherLookup(weather["datetime"])
 
 
-def get_weather_data(
-    df,
-    fname="weather2018.csv",
-):
+def get_weather_data(df, fname="weather2018.csv", fields=("conditions",)):
     """
-    Retrieves weather data for a given DataFrame of accidents.
+    Adds the weather of each accident: the "datetime" of its observation and
+    the weather fields. Accidents without weather are dropped.
+
+    Daily observations are matched on the accident "date", hourly ones on its
+    "crash_datetime" (the last observation before the crash), see
+    WeatherLookup. The weather is loaded once and looked up by position, so
+    the accident data is not merged nor copied.
 
     Args:
-        df (pandas.DataFrame): DataFrame containing accident data.
-        fnames (list, optional): List of file names for weather data CSV files. Defaults to ["new york city 2018-06-01 to 2018-08-31.csv", "new york city 2020-06-01 to 2020-08-31"].
+        df (pandas.DataFrame): DataFrame containing accident data, with the
+            "date" and "crash_datetime" columns parsed by get_accident_data.
+        fname (str, optional): Path to the weather CSV file.
+        fields (tuple, optional): Weather columns to add, such as
+            "conditions", "temp" or "precip".
 
     Returns:
         pandas.DataFrame: DataFrame containing merged accident and weather data.
     """
-    df_weather = pd.read_csv(fname)
+    weather, lookup = get_weather_lookup(fname)
+    idx = lookup.lookup(df["date"] if lookup.daily else df["crash_datetime"])
+    keep = idx >= 0
+    # a shallow copy, the columns are shared with df
+    data = df.copy(deep=False) if keep.all() else df[keep].copy(deep=False)
+    data.index = pd.RangeIndex(len(data))
+    idx = idx[keep]
+    for col in ["datetime", *fields]:
+        data[col] = weather[col].to_numpy()[idx]
+    return set_categories(data)
+
+
+def _clean_partition(args):
+    """
+    Cleans a partition of the raw records and merges it with the weather, in
+    a worker process of clean_partitions.
+    """
+    raw, weather_data, boroughs = args
+    return get_weather_data(clean_accident_data(raw, boroughs=boroughs), weather_data)
 
-    weather_cond = df_weather[["datetime", "conditions"]].copy()
-    weather_cond["datetime"] = pd.to_datetime(
-        weather_cond["datetime"], format="%Y-%m-%d"
-    )
 
-    df["date"] = pd.to_datetime(pd.to_datetime(df["CRASH DATE"]).dt.date)
+def clean_partitions(
+    raw, weather_data="weather2018.csv", processes=None, partitions=None, boroughs=None
+):
+    """
+    Cleans raw accident records and merges them with the weather in parallel.
+    The records are split into ranges of crash dates with about the same
+    number of records, which are processed by a pool of worker processes. The
+    result is the same as processing all the records at once, in the same
+    order.
 
-    data = df.merge(weather_cond, left_on="date", right_on="datetime", how="inner")
-    return data
+    Parameters:
+    - raw: DataFrame - Raw accident records, with the columns of the CSV file.
+    - weather_data: str - Path to the weather CSV file.
+    - processes: int, optional - Number of worker processes. Defaults to the
+      number of cores.
+    - partitions: int, optional - Number of date ranges. Defaults to twice
+      the number of processes, which balances the load without paying the
+      fixed cost of each partition too many times.
+    - boroughs: str, optional - File with the borough polygons, see
+      get_buroughs.
+
+    Returns:
+    - accident_data: DataFrame - The cleaned records with their weather.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    processes = processes or os.cpu_count()
+    partitions = partitions or 2 * processes
+
+    # the records of other vehicles are dropped before being sent to the
+    # workers, and only the distinct dates are parsed here
+    raw = filter_accident_vehicles(raw)
+    days = parse_cached(raw["CRASH DATE"], crash_date_format).dt.normalize()
+    counts = days.value_counts().sort_index()
+    before = counts.cumsum() - counts
+    ranges = (before * partitions // counts.sum()).astype(int)
+    parts = [part for _, part in raw.groupby(days.map(ranges).to_numpy(), sort=True)]
+
+    with ProcessPoolExecutor(processes) as pool:
+        results = list(
+            pool.map(
+                _clean_partition, [(part, weather_data, boroughs) for part in parts]
+            )
+        )
+    # the records keep their position in the raw data (index_left, see
+    # assign_boroughs), which restores the order of the serial processing
+    accident_data = pd.concat(results, ignore_index=True)
+    accident_data = accident_data.sort_values(
+        "index_left", kind="stable", ignore_index=True
+    )
+    # the partitions can have different categories, which concat drops
+    return set_categories(accident_data)
 
 
 def get_clean_data(
-    raw_data = "dataset_v1.csv",
-    weather_data = "weather2018.csv",
+    raw_data="dataset_v1.csv",
+    weather_data="weather2018.csv",
+    clean_data="clean_data.csv",
+    processes=1,
+):
+    """
+    Builds the cleaned dataset from the raw accident and weather data. It is
+    written both as CSV and as a columnar (Parquet) cache next to it.
+
+    Parameters:
+    - raw_data: str - Path to the raw accident CSV file.
+    - weather_data: str - Path to the weather CSV file.
+    - clean_data: str - Path of the output CSV file.
+    - processes: int, optional - Number of processes preprocessing the data,
+      see clean_partitions. None uses all the cores.
+
+    Returns:
+    - accident_data: DataFrame - The cleaned dataset.
+    """
+    if processes == 1:
+        data = get_accident_data(fname=raw_data, sample=False)
+        accident_data = get_weather_data(data, fname=weather_data)
+    else:
+        accident_data = clean_partitions(
+            pd.read_csv(raw_data), weather_data, processes=processes
+        )
+    accident_data.to_csv(clean_data)
+    write_clean_cache(accident_data, get_cache_path(clean_data))
+    return accident_data
+
+
+def get_fingerprint(accident_data):
+    """
+    Returns a hash of the contents of a DataFrame, which identifies the
+    dataset when caching what is built from it.
+
+    Parameters:
+    - accident_data: DataFrame - The data to hash.
+
+    Returns:
+    - fingerprint: str - The hexadecimal hash.
+    """
+    hashes = pd.util.hash_pandas_object(accident_data, index=False).to_numpy()
+    fingerprint = hashlib.sha1(hashes.tobytes())
+    fingerprint.update("|".join(map(str, accident_data.columns)).encode())
+    return fingerprint.hexdigest()
+
+
+def get_cache_path(fname):
+    """
+    Returns the path of the columnar cache corresponding to a CSV file.
+    """
+    return os.path.splitext(fname)[0] + ".parquet"
+
+
+def write_clean_cache(accident_data, fname="clean_data.parquet"):
+    """
+    Writes the cleaned dataset to a Parquet file. The columns of
+    category_values and other repeated string columns are stored as
+    categoricals, dates as datetimes and integers with the smallest dtype that
+    fits them.
+
+    Parameters:
+    - accident_data: DataFrame - The cleaned dataset.
+    - fname: str - Path of the Parquet file.
+    """
+    df = accident_data.drop(
+        columns=[c for c in accident_data.columns if c.startswith("Unnamed:")]
+    )
+    for col in ["date", "datetime"]:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], format="%Y-%m-%d")
+    for col in df.select_dtypes(include="integer").columns:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    set_categories(df)
+    for col in df.select_dtypes(include="object").columns:
+        # only columns with many repeated values benefit from a dictionary
+        if df[col].nunique() < len(df) / 2:
+            df[col] = df[col].astype("category")
+    # written to a temporary file first, as other processes may be reading
+    # the previous cache
+    tmp = f"{fname}.{os.getpid()}.tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, fname)
+
+
+def load_clean_data(fname="clean_data.csv", columns=None):
+    """
+    Loads the cleaned dataset from its Parquet cache, reading only the
+    requested columns. The cache is (re)built from the CSV file if it does not
+    exist or is older than the CSV.
+
+    Parameters:
+    - fname: str - Path to the cleaned CSV file, or to a store directory
+      written by ingest_accident_data.
+    - columns: list, optional - Columns to read. Defaults to all of them.
+
+    Returns:
+    - accident_data: DataFrame - The cleaned dataset.
+    """
+    if os.path.isdir(fname):
+        return read_store(fname, columns)
+    cache = get_cache_path(fname)
+    if not os.path.exists(cache) or (
+        os.path.exists(fname) and os.path.getmtime(cache) < os.path.getmtime(fname)
+    ):
+        try:
+            write_clean_cache(pd.read_csv(fname), cache)
+        except OSError:
+            # read-only deployments fall back to parsing the CSV
+            accident_data = set_categories(pd.read_csv(fname, usecols=columns))
+            return accident_data if columns is None else accident_data[columns]
+    return pd.read_parquet(cache, columns=columns)
+
+
+def get_mark_path(store):
+    """
+    Returns the path of the file holding the high-water mark of a store.
+    Files starting with an underscore are not read as data.
+    """
+    return os.path.join(store, "_high_water_mark.json")
+
+
+def read_high_water_mark(store):
+    """
+    Returns the largest COLLISION_ID ingested into a store, or None if nothing
+    was ingested yet, and the list of the COLLISION_IDs below it which are
+    waiting for their weather.
+    """
+    try:
+        with open(get_mark_path(store)) as f:
+            mark = json.load(f)
+    except FileNotFoundError:
+        return None, []
+    return mark["COLLISION_ID"], mark.get("pending", [])
+
+
+def write_high_water_mark(store, mark, pending=()):
+    """
+    Stores the high-water mark of a store and the records waiting for their
+    weather, replacing the previous ones atomically.
+    """
+    os.makedirs(store, exist_ok=True)
+    tmp = get_mark_path(store) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"COLLISION_ID": int(mark), "pending": sorted(map(int, pending))}, f)
+    os.replace(tmp, get_mark_path(store))
+
+
+def write_store_partitions(accident_data, store, batch):
+    """
+    Appends cleaned accidents to a store, partitioned by crash day. Each
+    append writes new files named after its batch, so writing the same batch
+    again replaces them instead of duplicating the rows.
+
+    Parameters:
+    - accident_data: DataFrame - The cleaned accidents.
+    - store: str - Path of the store directory.
+    - batch: int or str - Identifier of the batch.
+    """
+    df = accident_data.drop(
+        columns=[c for c in accident_data.columns if c.startswith("Unnamed:")]
+    )
+    # the files of all the batches must have the same schema, whatever the
+    # values of each batch: integer columns which can have missing values in
+    # the raw data are stored as floats, and text as strings
+    for col in df.columns:
+        if df[col].dtype == bool or pd.api.types.is_datetime64_any_dtype(df[col]):
+            continue
+        if col in store_int_cols:
+            df[col] = df[col].astype(np.int64)
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype(np.float64)
+        else:
+            df[col] = df[col].astype("string")
+    df["crash_day"] = df["date"].dt.strftime("%Y-%m-%d")
+    df.to_parquet(
+        store,
+        partition_cols=["crash_day"],
+        index=False,
+        basename_template=f"batch-{batch}-{{i}}.parquet",
+    )
+
+
+def read_store(store, columns=None):
+    """
+    Reads the cleaned accidents of a store.
+
+    Parameters:
+    - store: str - Path of the store directory.
+    - columns: list, optional - Columns to read. Defaults to all of them.
+
+    Returns:
+    - accident_data: DataFrame - The cleaned dataset.
+    """
+    df = pd.read_parquet(store, columns=columns)
+    return set_categories(df.drop(columns=["crash_day"], errors="ignore"))
+
+
+def filter_accident_vehicles(df):
+    """
+    Keeps the raw accident records of the vehicle types used by the charts
+    (see vehicle_names). derive_accident_columns applies the same filter; this
+    allows dropping the other records before any parsing.
+    """
+    vehicles = df["VEHICLE TYPE CODE 1"]
+    keep = {v for v in vehicles.dropna().unique() if v.title() in vehicle_names}
+    return df[vehicles.isin(keep)].copy()
+
+
+def ingest_accident_data(
+    raw_data="dataset_v1.csv",
+    weather_data="weather2018.csv",
+    store="clean_data_store",
+    chunksize=None,
+    columns=None,
 ):
-    data = get_accident_data(fname="dataset_v1.csv", sample=False)
-    accident_data = get_weather_data(data, fname="weather2018.csv")
-    accident_data.to_csv("clean_data.csv")
+    """
+    Incrementally adds the new records of the raw accident file to a
+    date-partitioned store of cleaned accidents. Only the records with a
+    COLLISION_ID above the high-water mark of the store are preprocessed,
+    merged with the weather and appended, and the mark is then moved to the
+    largest COLLISION_ID read. Records filtered out (other periods or vehicles,
+    no coordinates) are not considered again. Records without weather, whose
+    day the weather file may not cover yet, are kept with the mark and retried
+    on each ingestion until they get it.
+
+    With a chunksize, the file is streamed: each chunk is filtered, cleaned
+    and written before the next one is read, so the memory used depends on
+    the size of the chunks and not of the file.
+
+    Parameters:
+    - raw_data: str - Path to the raw accident CSV file.
+    - weather_data: str - Path to the weather CSV file.
+    - store: str - Path of the store directory, see load_clean_data.
+    - chunksize: int, optional - Number of raw records read at once. Defaults
+      to the whole file.
+    - columns: list, optional - Raw columns to read, such as raw_cols.
+      Defaults to all of them.
+
+    Returns:
+    - n: int - The number of accidents added.
+    """
+    mark, pending = read_high_water_mark(store)
+    pending = set(pending)
+    chunks = pd.read_csv(raw_data, usecols=columns, chunksize=chunksize)
+    if chunksize is None:
+        chunks = [chunks]
+
+    n = 0
+    last = mark
+    # the records still without weather, including the pending ones which are
+    # not in the file
+    waiting = set(pending)
+    for raw in chunks:
+        ids = raw["COLLISION_ID"]
+        batches = []
+        if pending:
+            retried = raw[ids.isin(pending)]
+            waiting -= set(retried["COLLISION_ID"])
+            batches.append((retried, None))
+        if mark is not None:
+            raw = raw[ids > mark]
+        if not raw.empty:
+            # each chunk is a batch named after its largest COLLISION_ID
+            batch = int(raw["COLLISION_ID"].max())
+            last = batch if last is None else max(last, batch)
+            batches.append((raw, batch))
+
+        for raw, batch in batches:
+            if raw.empty:
+                continue
+            cleaned = clean_accident_data(filter_accident_vehicles(raw))
+            accident_data = get_weather_data(cleaned, fname=weather_data)
+            waiting |= set(cleaned["COLLISION_ID"]) - set(accident_data["COLLISION_ID"])
+            if not len(accident_data):
+                continue
+            if batch is None:
+                # the retried records are only written once, so the smallest
+                # one names their batch
+                batch = f"retry-{int(accident_data['COLLISION_ID'].min())}"
+            write_store_partitions(accident_data, store, batch)
+            n += len(accident_data)
+
+    # the mark is only moved once all the batches are written, so an
+    # interrupted ingestion is retried and rewrites the same files
+    if last is not None and (last != mark or waiting != pending):
+        write_high_water_mark(store, last, waiting)
+    return n
+
+
+def snap_coordinates(accident_data, grid=0.005):
+    """
+    Rounds the accident coordinates to the centers of a regular grid, so that
+    accidents close to each other can be aggregated together.
+
+    Parameters:
+    - accident_data: DataFrame - The accident data.
+    - grid: float - The size of the grid cells, in degrees.
+
+    Returns:
+    - accident_data: DataFrame - A copy of the data with snapped coordinates.
+    """
+    accident_data = accident_data.copy()
+    for col in ["LATITUDE", "LONGITUDE"]:
+        accident_data[col] = ((accident_data[col] / grid).round() * grid).round(6)
     return accident_data
 
+
+def bin_coordinates(latitude, longitude, cell=0.01, shape="hex"):
+    """
+    Finds the cell of a hexagonal or square grid containing each point. The
+    grid is regular on the ground around map_latitude.
+
+    Parameters:
+    - latitude: array - The latitudes of the points.
+    - longitude: array - The longitudes of the points.
+    - cell: float - The distance between the centers of neighbouring cells, in
+      degrees of latitude.
+    - shape: str - "hex" for pointy-top hexagons or "square".
+
+    Returns:
+    - latitude: array - The latitude of the center of the cell of each point.
+    - longitude: array - The longitude of the center of the cell of each point.
+    """
+    scale = np.cos(np.radians(map_latitude))
+    x = np.asarray(longitude, dtype=float) * scale
+    y = np.asarray(latitude, dtype=float)
+    if shape == "square":
+        x = np.round(x / cell) * cell
+        y = np.round(y / cell) * cell
+    else:
+        # axial coordinates of the hexagons, whose radius makes neighbouring
+        # centers cell apart
+        radius = cell / np.sqrt(3)
+        q = (x * np.sqrt(3) / 3 - y / 3) / radius
+        r = y * 2 / 3 / radius
+        # the nearest hexagon: the three cube coordinates are rounded and the
+        # one with the largest error is recomputed from the others
+        rq, rr, rs = np.round(q), np.round(r), np.round(-q - r)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs + q + r)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        rq = np.where(fix_q, -rr - rs, rq)
+        rr = np.where(fix_r, -rq - rs, rr)
+        x = radius * np.sqrt(3) * (rq + rr / 2)
+        y = radius * 1.5 * rr
+    return y.round(6), (x / scale).round(6)
+
+
+def get_density_data(accident_data, shape="hex", resolutions=map_resolutions):
+    """
+    Counts the accidents of each cell of the density map and borough, at each
+    resolution.
+
+    Parameters:
+    - accident_data: DataFrame - The accident data.
+    - shape: str - The shape of the cells, see bin_coordinates.
+    - resolutions: dict - The cell size of each resolution, by name.
+
+    Returns:
+    - cells: DataFrame - The resolution ("level"), the center of the cell
+      ("LATITUDE", "LONGITUDE"), the borough ("name") and the number of
+      accidents ("n") of each cell with accidents.
+    """
+    cells = []
+    for level, cell in resolutions.items():
+        latitude, longitude = bin_coordinates(
+            accident_data["LATITUDE"], accident_data["LONGITUDE"], cell, shape
+        )
+        counts = (
+            pd.DataFrame(
+                {
+                    "LATITUDE": latitude,
+                    "LONGITUDE": longitude,
+                    "name": accident_data["name"].to_numpy(),
+                }
+            )
+            .groupby(["LATITUDE", "LONGITUDE", "name"], observed=True)
+            .size()
+            .reset_index(name="n")
+        )
+        counts.insert(0, "level", level)
+        cells.append(counts)
+    return pd.concat(cells, ignore_index=True)
+
+
+def get_cells(accident_data, shape="hex", cell=0.01):
+    """
+    Finds the cell of the density map containing each accident.
+
+    Parameters:
+    - accident_data: DataFrame - The accident data.
+    - shape: str - The shape of the cells, see bin_coordinates.
+    - cell: float - The size of the cells, see bin_coordinates.
+
+    Returns:
+    - ids: array - The id of the cell of each accident, -1 without coordinates.
+    - cells: DataFrame - The id ("cell") and the center ("LATITUDE",
+      "LONGITUDE") of each cell with accidents.
+    """
+    latitude, longitude = bin_coordinates(
+        accident_data["LATITUDE"], accident_data["LONGITUDE"], cell, shape
+    )
+    grouped = pd.DataFrame({"LATITUDE": latitude, "LONGITUDE": longitude}).groupby(
+        ["LATITUDE", "LONGITUDE"]
+    )
+    ids = grouped.ngroup().to_numpy().astype(np.int32)
+    cells = grouped.size().index.to_frame(index=False)
+    cells.insert(0, "cell", np.arange(len(cells)))
+    return ids, cells
+
+
+def get_cell_features(cells, shape="hex", cell=0.01):
+    """
+    Turns the cells of the density map into GeoJSON features with their
+    polygon, which the map draws as shapes.
+
+    Parameters:
+    - cells: DataFrame - The cells, see get_cells.
+    - shape: str - The shape of the cells, see bin_coordinates.
+    - cell: float - The size of the cells, see bin_coordinates.
+
+    Returns:
+    - features: list - A feature for each cell, with its id ("cell").
+    """
+    scale = np.cos(np.radians(map_latitude))
+    if shape == "square":
+        x = np.array([-0.5, -0.5, 0.5, 0.5, -0.5])
+        y = np.array([-0.5, 0.5, 0.5, -0.5, -0.5])
+    else:
+        # corners of a pointy-top hexagon of radius 1, the radius of the cells
+        # being cell / sqrt(3)
+        angles = np.radians(np.arange(90, -300, -60))
+        x = np.cos(angles) / np.sqrt(3)
+        y = np.sin(angles) / np.sqrt(3)
+    features = []
+    # the rings go clockwise, which Vega takes as the inside of the polygons
+    for record in cells.to_dict("records"):
+        longitude = (record["LONGITUDE"] + x * cell / scale).round(6)
+        latitude = (record["LATITUDE"] + y * cell).round(6)
+        polygon = [list(point) for point in zip(longitude.tolist(), latitude.tolist())]
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [polygon]},
+                "cell": record["cell"],
+            }
+        )
+    return features
+
+
+def get_view_data(accident_data, view, aggregated=False):
+    """
+    Returns the data used by a view of the visualization.
+
+    When aggregated, the accidents are counted by Python, grouped by the fields
+    the view encodes (view_fields), into an "n" column which the charts sum
+    instead of counting rows. The size of the result depends only on the number
+    of distinct values of those fields, not on the number of accidents. As the
+    other fields are not kept, the views cannot filter each other in the
+    browser (see get_filter).
+
+    With aggregated="crossfilter", the view reads the same counts from a named
+    dataset which is provided with the spec, already filtered by the
+    selections of the other views (see crossfilter.py).
+
+    Parameters:
+    - accident_data: DataFrame - The accident data.
+    - view: str - One of the keys of view_fields.
+    - aggregated: bool or str - Whether to aggregate the data, or
+      "crossfilter".
+
+    Returns:
+    - data: DataFrame or alt.NamedData - The data of the view.
+    """
+    if aggregated == "crossfilter":
+        return alt.NamedData(name=get_dataset_name(view))
+    if not aggregated:
+        # the cells of the density map, see get_cells
+        cell = ["cell"] if "cell" in accident_data else []
+        return accident_data[filter_cols + cell]
+    return (
+        accident_data.groupby(view_fields[view], observed=True, dropna=False)
+        .size()
+        .reset_index(name="n")
+    )
+
+
+def get_dataset_name(view):
+    """
+    Returns the name of the dataset holding the counts of a view when the
+    views are cross-filtered in Python.
+    """
+    return f"view_{view}"
+
+
+def write_dataset(values, directory):
+    """
+    Writes the records of a dataset to a compact JSON file named by the hash
+    of its content. The file is only written if it does not exist yet, so
+    identical datasets share it.
+
+    Parameters:
+    - values: list - The records of the dataset.
+    - directory: str - The directory of the file.
+
+    Returns:
+    - name: str - The name of the file.
+    - digest: str - The hexadecimal hash of its content.
+    """
+    content = json.dumps(values, separators=(",", ":")).encode()
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    name = f"{digest}.json"
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        # written to a temporary file first, as other processes may be
+        # reading the same file
+        with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+            f.write(content)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+    return name, digest
+
+
+def link_datasets(spec, data):
+    """
+    Replaces the references to the named datasets of a spec by other data,
+    such as the URLs of their files.
+
+    Parameters:
+    - spec: dict - The Vega-Lite spec, which is modified in place.
+    - data: dict - The data of each dataset, by name, e.g. {"url": "a.json"}.
+    """
+    if isinstance(spec, dict):
+        name = spec.get("name")
+        if isinstance(name, str) and name in data and "values" not in spec:
+            del spec["name"]
+            spec.update(data[name])
+        for value in spec.values():
+            link_datasets(value, data)
+    elif isinstance(spec, list):
+        for value in spec:
+            link_datasets(value, data)
+
+
+def to_static_urls(spec, directory=static_data_dir, urlpath=static_data_url):
+    """
+    Moves the datasets of a spec to files (see write_dataset), which its views
+    then reference by URL instead of inlining them.
+
+    The URL holds the hash of the content as a "v" query argument, which
+    makes the static file server of Streamlit send long-lived cache headers:
+    browsers and proxies keep the data across reruns, page loads and users,
+    and a new dataset gets a new URL.
+
+    Parameters:
+    - spec: dict - The Vega-Lite spec, which is modified in place.
+    - directory: str - The directory the files are written to.
+    - urlpath: str - The URL of the directory, relative to the page.
+
+    Returns:
+    - spec: dict - The spec.
+    """
+    data = {}
+    for name, values in spec.pop("datasets", {}).items():
+        file_name, digest = write_dataset(values, directory)
+        url = f"{urlpath}/{file_name}?v={digest}"
+        data[name] = {"url": url, "format": {"type": "json"}}
+    link_datasets(spec, data)
+    return spec
+
+
+def get_filter(aggregated, predicate):
+    """
+    Returns the filter applied to a view by the selections of the other views.
+    Pre-aggregated views do not have the fields of the other selections, so
+    they are not filtered and the selections only highlight their own view.
+
+    Parameters:
+    - aggregated: bool - Whether the data of the view is aggregated.
+    - predicate: The combination of selections filtering the view.
+    """
+    return "true" if aggregated else predicate
+
+
+def get_count(aggregated, typed=True):
+    """
+    Returns the shorthand counting the accidents of a group: count() on row
+    level data and the sum of the precomputed counts on aggregated data.
+
+    Parameters:
+    - aggregated: bool - Whether the data is aggregated.
+    - typed: bool - Whether to include the type, as needed in encodings but not
+      in transforms.
+    """
+    if not aggregated:
+        return "count()"
+    return "sum(n):Q" if typed else "sum(n)"
+
+
 def get_map_chart(
     accident_data,
     selection_buro,
@@ -260,6 +1391,12 @@ def get_map_chart(
     h2=200,
     ratio=0.8,
     use_interval=True,
+    geo_level="medium",
+    aggregated=False,
+    density=None,
+    cells=None,
+    filter_points=False,
+    tooltips=True,
 ):
     """
     Creates an interactive map of New York City, showing the number of accidents per burough
@@ -272,16 +1409,33 @@ def get_map_chart(
         - h1 (int): the height of the map chart
         - h2 (int): the height of the bar chart
         - ratio (float): the ratio between the map chart and the bar chart in width
+        - aggregated (bool): whether to use pre-aggregated data, see get_view_data
+        - geo_level (str): the simplification level of the borough shapes
+          ("full", "high", "medium" or "low")
+        - density (str): the shape of the cells ("hex" or "square") in which
+          the accidents are counted to draw their density instead of each
+          accident, see get_cells. The accidents are counted by cell once
+          filtered by the other views, and each count gets the polygon of its
+          cell from the cells. The map then has no interval selection: a
+          selection on a map holds the ids of the marks under the brush, which
+          the other views can only test if the marks are the accidents.
+        - cells (list): with density, the features of the cells, see
+          get_cell_features. The accidents have the id of their cell ("cell").
+        - filter_points (bool): whether the accidents outside the selections of
+          the map are removed from the points instead of being drawn
+          transparent. The map then also draws the density of all the
+          accidents under the points.
+        - tooltips (bool): whether the points have an empty tooltip, which
+          makes Vega search them on every pointer move, see render_profiles
 
     """
-    ny = "https://raw.githubusercontent.com/pauamargant/VI_P1/main/resources/new-york-city-boroughs.geojson"
-    data_geojson_remote = alt.Data(
-        url=ny, format=alt.DataFormat(property="features", type="json")
-    )
+    # The borough shapes are simplified and inlined in the chart, see
+    # borough_shapes.py
+    data_geo = get_shapes_data(geo_level)
 
     # We create the base map
     base = (
-        alt.Chart(data_geojson_remote)
+        alt.Chart(data_geo)
         .mark_geoshape(fill="lightgrey", stroke="white")
         .properties(
             width=500,
@@ -295,32 +1449,51 @@ def get_map_chart(
         .properties(width=w * ratio, height=h1)
     )
 
-    accident_data = accident_data[filter_cols]
+    if density:
+        density_data = get_view_data(accident_data, "density", aggregated)
+    elif filter_points:
+        fine = {"fine": map_resolutions["fine"]}
+        cells = get_density_data(accident_data, resolutions=fine)
+    borough_data = get_view_data(accident_data, "borough", aggregated)
+    accident_data = get_view_data(accident_data, "map", aggregated)
+    count = get_count(aggregated)
 
     # We create the points corresponding to the accidents
     points = (
         alt.Chart(accident_data)
         .transform_filter(
-            selection_cond
-            & selection_month
-            & selection_weekday
-            & selection_vehicle
-            & time_brush
-            & selection_injured
-            & selection_acc_factor
-            & selection_week
+            get_filter(
+                aggregated,
+                selection_cond
+                & selection_month
+                & selection_weekday
+                & selection_vehicle
+                & time_brush
+                & selection_injured
+                & selection_acc_factor
+                & selection_week
+            )
         )
         .mark_circle()
         .encode(
             longitude="LONGITUDE:Q",
             latitude="LATITUDE:Q",
-            size=alt.value(2),
+            # The aggregated data has a row per point, drawn as is: summing it
+            # in the browser would make new rows with new ids (_vgsid_), which
+            # the interval selection holds (see CrossFilter.get_mask)
+            size=(
+                alt.Size("n:Q", legend=None, scale=alt.Scale(range=[2, 40]))
+                if aggregated
+                else alt.value(2)
+            ),
             color=alt.Color(
                 "name:N",
                 legend=alt.Legend(title="Borough", orient="top-left"),
             ).scale(
                 # scheme="category20c"
-                range=["#66c2a5", "#fc8d62", "#8da0cb", "#e78ac3", "#a6d854"]
+                # the filtered points keep the colors of their boroughs
+                domain=borough_names if filter_points else alt.Undefined,
+                range=["#66c2a5", "#fc8d62", "#8da0cb", "#e78ac3", "#a6d854"],
             ),
             opacity=alt.condition(
                 selection_buro & selection_acc_map, alt.value(1), alt.value(0)
@@ -329,33 +1502,109 @@ def get_map_chart(
         )
     )
 
-    if use_interval:
-        points = points.add_selection(selection_acc_map)
+    if density:
+        # The accidents are counted by cell, and the cells drawn as shapes
+        # colored by their number of accidents
+        density_cells = (
+            alt.Chart(density_data)
+            .transform_filter(
+                get_filter(
+                    aggregated,
+                    selection_cond
+                    & selection_month
+                    & selection_weekday
+                    & selection_vehicle
+                    & time_brush
+                    & selection_injured
+                    & selection_acc_factor
+                    & selection_week
+                )
+            )
+            .transform_aggregate(
+                n=get_count(aggregated, typed=False), groupby=["cell", "name"]
+            )
+            .transform_lookup(
+                lookup="cell",
+                from_=alt.LookupData(alt.Data(values=cells), key="cell"),
+                as_="geometry",
+            )
+            .mark_geoshape(stroke=None)
+            .encode(
+                shape="geometry:G",
+                color=alt.Color(
+                    "n:Q",
+                    legend=alt.Legend(title="Accidents", orient="top-left"),
+                    scale=alt.Scale(type="log", range=seq[::-1]),
+                ),
+                opacity=alt.condition(
+                    selection_buro & selection_acc_map, alt.value(0.9), alt.value(0.2)
+                ),
+                tooltip=[
+                    alt.Tooltip("name:N", title="Borough"),
+                    alt.Tooltip("n:Q", title="No. accidents"),
+                ],
+            )
+        )
+
+    elif filter_points:
+        # The interval selection holds the ids of the marks under the brush,
+        # which the other views test their rows against, so it must be on the
+        # accidents, and a layer cannot be filtered by its own selection. It
+        # is then on a transparent layer of the points, and only the selected
+        # points are drawn over it, over the density of all the accidents.
+        if use_interval:
+            brush = points.mark_circle(opacity=0)
+            brush.encoding.color = alt.Undefined
+            brush.encoding.opacity = alt.Undefined
+            brush.encoding.tooltip = alt.Undefined
+        points = points.transform_filter(selection_buro & selection_acc_map)
+        points.encoding.opacity = alt.Undefined
+        points.encoding.tooltip = alt.Undefined
+        context = (
+            alt.Chart(cells)
+            .mark_circle(color="gray", opacity=0.3)
+            .encode(
+                longitude="LONGITUDE:Q",
+                latitude="LATITUDE:Q",
+                size=alt.Size("n:Q", legend=None, scale=alt.Scale(range=[2, 40])),
+            )
+        )
+
+    if not tooltips:
+        points.encoding.tooltip = alt.Undefined
+
+    if use_interval and filter_points and not density:
+        brush = brush.add_params(selection_acc_map)
+    elif use_interval and not density:
+        points = points.add_params(selection_acc_map)
 
     # We create the bar chart of the number of accidents per burough
     bar_chart = (
-        alt.Chart(accident_data)
+        alt.Chart(borough_data)
         .mark_bar()
         .transform_filter(
-            selection_cond
-            & selection_month
-            & selection_weekday
-            & selection_vehicle
-            & time_brush
-            & selection_injured
-            & selection_acc_map
-            & selection_acc_factor
-            & selection_week
+            get_filter(
+                aggregated,
+                selection_cond
+                & selection_month
+                & selection_weekday
+                & selection_vehicle
+                & time_brush
+                & selection_injured
+                & selection_acc_map
+                & selection_acc_factor
+                & selection_week
+            )
         )
         .encode(
-            x=alt.X("count()", axis=alt.Axis(title=None)),
+            x=alt.X(count, axis=alt.Axis(title=None)),
             y=alt.Y("name:N", axis=alt.Axis(title="Boroughs")).sort("-x"),
             opacity=alt.condition(selection_buro, alt.value(1), alt.value(0.4)),
             color=alt.Color("name:N", legend=None).scale(
                 range=["#66c2a5", "#fc8d62", "#8da0cb", "#e78ac3", "#a6d854"]
             ),
             tooltip=[
-                alt.Tooltip("count()", title="No. accidents"),
+                alt.Tooltip(count, title="No. accidents"),
                 alt.Tooltip("name:N", title="Borough"),
             ],
         )
@@ -363,9 +1612,17 @@ def get_map_chart(
     )
 
     # We create the layered chart and return a tuple with the map and the bar chart
-    return (base + points).add_params(selection_buro), bar_chart.add_params(
-        selection_buro
-    )
+    if density:
+        # the colors of the cells are their own, not merged with the
+        # quantitative color scales of the other charts
+        geo_view = (base + density_cells).resolve_scale(color="independent")
+    elif filter_points and use_interval:
+        geo_view = base + context + brush + points
+    elif filter_points:
+        geo_view = base + context + points
+    else:
+        geo_view = base + points
+    return geo_view.add_params(selection_buro), bar_chart.add_params(selection_buro)
 
 
 def get_vehicle_chart(
@@ -382,6 +1639,7 @@ def get_vehicle_chart(
     selection_week,
     w=500,
     h=300,
+    aggregated=False,
 ):
     """
     Creates a layered bar chart showing the percentage of accidents by vehicle type.
@@ -391,34 +1649,41 @@ def get_vehicle_chart(
     - (Selectors for interactivity)
     - w: int - The width of the chart (default: 500).
     - w: int - The height of the chart (default: 300).
+    - aggregated: bool - Whether to use pre-aggregated data, see get_view_data.
 
     Returns:
     - layered_chart: LayeredChart - The layered bar chart visualizing the data.
     """
-    df = df[filter_cols]
+    df = get_view_data(df, "vehicle", aggregated)
+    count = get_count(aggregated)
     bar_chart = (
         alt.Chart(df)
         .transform_filter(
-            selection_buro
-            & selection_month
-            & selection_weekday
-            & selection_cond
-            & time_brush
-            & selection_injured
-            & selection_acc_map
-            & selection_acc_factor
-            & selection_week
+            get_filter(
+                aggregated,
+                selection_buro
+                & selection_month
+                & selection_weekday
+                & selection_cond
+                & time_brush
+                & selection_injured
+                & selection_acc_map
+                & selection_acc_factor
+                & selection_week
+            )
         )
         .mark_bar()
         .encode(
+            # layers only keep sorts by count, min or max, so the aggregated
+            # data (one row per vehicle) is sorted by the max of its counts
             y=alt.Y(
                 "VEHICLE TYPE CODE 1:N",
                 title=None,
-            ).sort("x"),
-            x=alt.X("count()", title="Number of accidents"),
+            ).sort(alt.EncodingSortField("n", op="max") if aggregated else "x"),
+            x=alt.X(count, title="Number of accidents"),
             tooltip=[
                 alt.Tooltip("VEHICLE TYPE CODE 1:N", title="Type of vehicle"),
-                alt.Tooltip("count()", title="No. accidents"),
+                alt.Tooltip(count, title="No. accidents"),
             ],
             opacity=alt.condition(selection_vehicle, alt.value(1), alt.value(0.2)),
         )
@@ -432,7 +1697,7 @@ def get_vehicle_chart(
         fontSize=12,
         dx=3,  # Adjust the horizontal position of the labels
     ).encode(
-        text=alt.Text("count()"),
+        text=alt.Text(count),
         color=alt.value("black"),
     )
 
@@ -467,6 +1732,7 @@ def get_weather_chart(
     w=500,
     h=300,
     ratio=0.8,
+    aggregated=False,
 ):
     """
     Creates a layered bar chart showing the count of accidents per weather type.
@@ -476,6 +1742,7 @@ def get_weather_chart(
     - (Selectors for interactivity)
     - w: int - The width of the chart (default: 500).
     - w: int - The height of the chart (default: 300).
+    - aggregated: bool - Whether to use pre-aggregated data, see get_view_data.
 
     Returns:
     - layered_chart: LayeredChart - The layered bar chart visualizing the data.
@@ -488,19 +1755,23 @@ def get_weather_chart(
         "Rain, Overcast",
         "Rain, Partially cloudy",
     ]
-    accident_data = accident_data[filter_cols]
+    accident_data = get_view_data(accident_data, "weather", aggregated)
+    count = get_count(aggregated)
     bar_legend = (
         alt.Chart(accident_data)
         .transform_filter(
-            selection_acc_map
-            & selection_month
-            & selection_weekday
-            & selection_vehicle
-            & time_brush
-            & selection_injured
-            & selection_acc_factor
-            & selection_buro
-            & selection_week
+            get_filter(
+                aggregated,
+                selection_acc_map
+                & selection_month
+                & selection_weekday
+                & selection_vehicle
+                & time_brush
+                & selection_injured
+                & selection_acc_factor
+                & selection_buro
+                & selection_week
+            )
         )
         .mark_rect()
         .encode(
@@ -510,13 +1781,13 @@ def get_weather_chart(
                 axis=alt.Axis(title=None, labelLimit=2000),
             ),
             color=alt.Color(
-                "count()",
+                count,
                 legend=alt.Legend(title="No. accidents"),
                 scale=alt.Scale(scheme="purples"),
             ),
             opacity=alt.condition(selection_cond, alt.value(1), alt.value(0.2)),
             tooltip=[
-                alt.Tooltip("count()", title="No. accidents"),
+                alt.Tooltip(count, title="No. accidents"),
                 alt.Tooltip("conditions:N", title="Weather"),
             ],
         )
@@ -541,6 +1812,8 @@ def get_calendar_chart(
     w=500,
     h=300,
     ratio=0.8,
+    aggregated=False,
+    tooltips=True,
 ):
     """
     Creates a layered bar chart showing the accident count in a calendar like chart.
@@ -550,34 +1823,32 @@ def get_calendar_chart(
     - (Selectors for interactivity)
     - w: int - The width of the chart (default: 500).
     - w: int - The height of the chart (default: 300).
+    - aggregated: bool - Whether to use pre-aggregated data, see get_view_data.
+    - tooltips: bool - Whether the days have a tooltip, see render_profiles.
 
     Returns:
     - layered_chart: LayeredChart - The layered bar chart visualizing the data.
     """
-    accident_data = accident_data[filter_cols]
+    accident_data = get_view_data(accident_data, "calendar", aggregated)
+    count = get_count(aggregated)
 
-    order = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
+    order = day_names
     month_order = ["June", "July", "August", "September"]
 
     calendars = (
         alt.Chart(accident_data)
         .transform_filter(
-            selection_acc_map
-            & selection_cond
-            & selection_month
-            & selection_vehicle
-            & time_brush
-            & selection_injured
-            & selection_acc_factor
-            & selection_buro
+            get_filter(
+                aggregated,
+                selection_acc_map
+                & selection_cond
+                & selection_month
+                & selection_vehicle
+                & time_brush
+                & selection_injured
+                & selection_acc_factor
+                & selection_buro
+            )
         )
         .mark_rect()
         .encode(
@@ -585,7 +1856,7 @@ def get_calendar_chart(
             x=alt.X("dayname:O", sort=order, axis=alt.Axis(title=None)),
             y=alt.Y("week:O", title=None, axis=alt.Axis(labels=False)),
             color=alt.Color(
-                "count()",
+                count,
                 scale=alt.Scale(scheme="greens"),
                 legend=alt.Legend(title="No. accidents", orient="top"),
             ),
@@ -594,10 +1865,14 @@ def get_calendar_chart(
                 alt.value(1),
                 alt.value(0.2),
             ),
-            tooltip=[
-                alt.Tooltip("fulldate:N", title="Date"),
-                alt.Tooltip("count()", title="No. accidents"),
-            ],
+            tooltip=(
+                [
+                    alt.Tooltip("fulldate:N", title="Date"),
+                    alt.Tooltip(count, title="No. accidents"),
+                ]
+                if tooltips
+                else alt.Undefined
+            ),
         )
         .properties(width=int(w), height=int(h / 4))
         .resolve_scale(y="independent")
@@ -622,6 +1897,7 @@ def get_counts_chart(
     w=100,
     h=70,
     ratio=0.8,
+    aggregated=False,
 ):
     """
     Creates a layered bar chart showing the total accident count, the currenlty selected count
@@ -632,18 +1908,38 @@ def get_counts_chart(
     - (Selectors for interactivity)
     - w: int - The width of the chart (default: 500).
     - w: int - The height of the chart (default: 300).
+    - aggregated: bool - Whether to use pre-aggregated data, see get_view_data.
 
     Returns:
     - layered_chart: LayeredChart - The layered bar chart visualizing the data.
     """
-    accident_data = accident_data[filter_cols]
+    total_data = get_view_data(accident_data, "total", aggregated)
+    accident_data = get_view_data(accident_data, "counts", aggregated)
+    count = get_count(aggregated)
+    selected = get_filter(
+        aggregated,
+        selection_acc_map
+        & selection_buro
+        & selection_cond
+        & selection_month
+        & selection_weekday
+        & selection_vehicle
+        & time_brush
+        & selection_acc_factor
+        & selection_injured
+        & selection_week,
+    )
+    if aggregated == "crossfilter":
+        # the counts are filtered by the other selections in Python, except
+        # the injured selection, which this view holds
+        selected = selection_injured
 
     total_chart = (
-        alt.Chart(accident_data)
+        alt.Chart(total_data)
         .mark_bar(cornerRadius=10)
         .encode(
             tooltip=[
-                alt.Tooltip("count()", title="No. accidents"),
+                alt.Tooltip(count, title="No. accidents"),
             ],
         )
     )
@@ -657,25 +1953,15 @@ def get_counts_chart(
             fontWeight="bold",
         )
         .encode(
-            text=alt.Text("count()"),
+            text=alt.Text(count),
             color=alt.value("white"),
             x=alt.X().axis(labels=False),
         )
         .properties(width=int(w), height=int(h), title="Total accidents")
     )
     selected_text = (
-        total_chart.transform_filter(
-            selection_acc_map
-            & selection_buro
-            & selection_cond
-            & selection_month
-            & selection_weekday
-            & selection_vehicle
-            & time_brush
-            & selection_acc_factor
-            & selection_injured
-            & selection_week
-        )
+        total_chart.properties(data=accident_data)
+        .transform_filter(selected)
         .mark_text(
             align="center",
             baseline="middle",
@@ -684,7 +1970,7 @@ def get_counts_chart(
             fontWeight="bold",
         )
         .encode(
-            text=alt.Text("count()"),
+            text=alt.Text(count),
             color=alt.value("white"),
             x=alt.X().axis(labels=False),
         )
@@ -694,20 +1980,23 @@ def get_counts_chart(
         alt.Chart(accident_data)
         .mark_bar(cornerRadius=10)
         .transform_filter(
-            selection_acc_map
-            & selection_buro
-            & selection_cond
-            & selection_month
-            & selection_weekday
-            & selection_vehicle
-            & time_brush
-            & selection_acc_factor
-            & selection_week
+            get_filter(
+                aggregated,
+                selection_acc_map
+                & selection_buro
+                & selection_cond
+                & selection_month
+                & selection_weekday
+                & selection_vehicle
+                & time_brush
+                & selection_acc_factor
+                & selection_week
+            )
         )
         .encode(
             opacity=alt.condition(selection_injured, alt.value(1), alt.value(0.2)),
             tooltip=[
-                alt.Tooltip("count()", title="No. accidents"),
+                alt.Tooltip(count, title="No. accidents"),
             ],
             # color=alt.value("blue"),
             x=alt.X(
@@ -726,7 +2015,7 @@ def get_counts_chart(
             fontWeight="bold",
         )
         .encode(
-            text=alt.Text("count()"),
+            text=alt.Text(count),
             color=alt.value("white"),
         )
         .properties(width=int(w * 1.8), height=int(h * 0.8))
@@ -751,6 +2040,7 @@ def get_month_chart(
     w=500,
     h=300,
     ratio=0.8,
+    aggregated=False,
 ):
     """
     Creates a layered bar chart showing the total accident count per month.
@@ -760,11 +2050,13 @@ def get_month_chart(
     - (Selectors for interactivity)
     - w: int - The width of the chart (default: 500).
     - w: int - The height of the chart (default: 300).
+    - aggregated: bool - Whether to use pre-aggregated data, see get_view_data.
 
     Returns:
     - layered_chart: LayeredChart - The layered bar chart visualizing the data."""
 
-    accident_data = accident_data[filter_cols]
+    accident_data = get_view_data(accident_data, "month", aggregated)
+    count = get_count(aggregated)
 
     month_order = ["June", "July", "August", "September"]
 
@@ -772,17 +2064,20 @@ def get_month_chart(
         alt.Chart(accident_data)
         .mark_bar(cornerRadius=10)
         .transform_filter(
-            selection_acc_map
-            & selection_cond
-            # & selection_month
-            & selection_weekday
-            & selection_vehicle
-            & time_brush
-            & selection_injured
-            & selection_acc_factor
+            get_filter(
+                aggregated,
+                selection_acc_map
+                & selection_cond
+                # & selection_month
+                & selection_weekday
+                & selection_vehicle
+                & time_brush
+                & selection_injured
+                & selection_acc_factor
+            )
         )
         .transform_window(
-            total_acc="count()",
+            total_acc=get_count(aggregated, typed=False),
             frame=[None, None],
             groupby=["monthname"],
         )
@@ -800,7 +2095,7 @@ def get_month_chart(
             opacity=alt.condition(selection_month, alt.value(1), alt.value(0.2)),
             tooltip=[
                 alt.Tooltip("monthname:N", title="Month"),
-                alt.Tooltip("count()", title="No. accidents"),
+                alt.Tooltip(count, title="No. accidents"),
                 alt.Tooltip("mean_accidents:Q", format=",.2f", title="Mean accidents"),
             ],
         )
@@ -836,6 +2131,7 @@ def get_time_of_day_chart(
     selection_week,
     w=600,
     h=300,
+    aggregated=False,
 ):
     """
     Creates a layered bar chart showing the accidents per time of day and weekday. It includes a bar chart for the time of day
@@ -846,25 +2142,19 @@ def get_time_of_day_chart(
     - (Selectors for interactivity)
     - w: int - The width of the chart (default: 500).
     - w: int - The height of the chart (default: 300).
+    - aggregated: bool - Whether to use pre-aggregated data, see get_view_data.
 
     Returns:
     - layered_chart: LayeredChart - The layered bar chart visualizing the data.
     """
-    df = df[filter_cols]
+    df = get_view_data(df, "time_of_day", aggregated)
+    count = get_count(aggregated)
     h1 = int(2 * h / 3)
     h2 = int(1 * h / 3)
     w1 = int(3 * w / 4)
     w2 = int(w / 8)
 
-    custom_sort = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
+    custom_sort = day_names
 
     base = (
         alt.Chart()
@@ -874,14 +2164,17 @@ def get_time_of_day_chart(
             y=alt.Y("dayname:O", sort=custom_sort, axis=alt.Axis(title=None)),
         )
         .transform_filter(
-            selection_cond
-            & selection_buro
-            & selection_vehicle
-            & selection_acc_map
-            & selection_acc_factor
-            & selection_month
-            & selection_injured
-            & selection_week
+            get_filter(
+                aggregated,
+                selection_cond
+                & selection_buro
+                & selection_vehicle
+                & selection_acc_map
+                & selection_acc_factor
+                & selection_month
+                & selection_injured
+                & selection_week
+            )
         )
     )
 
@@ -889,7 +2182,7 @@ def get_time_of_day_chart(
         base.mark_rect(stroke="grey")
         .encode(
             color=alt.Color(
-                "count()",
+                count,
                 scale=alt.Scale(scheme="tealblues"),
                 legend=alt.Legend(title="Number of accidents"),
             ),
@@ -897,7 +2190,7 @@ def get_time_of_day_chart(
                 time_brush & selection_weekday, alt.value(1), alt.value(0.2)
             ),
             tooltip=[
-                alt.Tooltip("count()", title="No. accidents"),
+                alt.Tooltip(count, title="No. accidents"),
                 alt.Tooltip("HOUR:O", title="Hour"),
                 alt.Tooltip("dayname:O", title="Day"),
             ],
@@ -910,25 +2203,28 @@ def get_time_of_day_chart(
         alt.Chart()
         .mark_bar()
         .transform_filter(
-            selection_cond
-            & selection_buro
-            & selection_vehicle
-            & selection_acc_map
-            & selection_acc_factor
-            & selection_month
-            & selection_week
-            & selection_injured
+            get_filter(
+                aggregated,
+                selection_cond
+                & selection_buro
+                & selection_vehicle
+                & selection_acc_map
+                & selection_acc_factor
+                & selection_month
+                & selection_week
+                & selection_injured
+            )
         )
         .encode(
             y=alt.Y(
-                "count()",
+                count,
                 scale=alt.Scale(reverse=False),
                 axis=alt.Axis(title="No. accidents"),
             ),
             x=alt.X("HOUR:O", axis=alt.Axis(title=None, labelAngle=0, orient="top")),
             opacity=alt.condition(time_brush, alt.value(1), alt.value(0.2)),
             tooltip=[
-                alt.Tooltip("count()", title="No. accidents"),
+                alt.Tooltip(count, title="No. accidents"),
                 alt.Tooltip("HOUR:O", title="Hour"),
             ],
         )
@@ -939,21 +2235,24 @@ def get_time_of_day_chart(
         alt.Chart()
         .mark_bar()
         .transform_filter(
-            selection_cond
-            & selection_buro
-            & selection_vehicle
-            & selection_acc_map
-            & selection_acc_factor
-            & selection_month
-            & selection_injured
-            & selection_week
+            get_filter(
+                aggregated,
+                selection_cond
+                & selection_buro
+                & selection_vehicle
+                & selection_acc_map
+                & selection_acc_factor
+                & selection_month
+                & selection_injured
+                & selection_week
+            )
         )
         .encode(
-            x=alt.X("count()", axis=alt.Axis(title="No. accidents")),
+            x=alt.X(count, axis=alt.Axis(title="No. accidents")),
             y=alt.Y("dayname:O", axis=None, sort=custom_sort),
             opacity=alt.condition(selection_weekday, alt.value(1), alt.value(0.2)),
             tooltip=[
-                alt.Tooltip("count()", title="No. accidents"),
+                alt.Tooltip(count, title="No. accidents"),
                 alt.Tooltip("dayname:O", title="Day"),
             ],
         )
@@ -983,6 +2282,7 @@ def get_factor_chart(
     selection_week,
     w=600,
     h=300,
+    aggregated=False,
 ):
     """
     Makes a bar chart showing the number of accidents per contributing factor. It shows the top 10.
@@ -992,25 +2292,29 @@ def get_factor_chart(
     - (Selectors for interactivity)
     - w: int - The width of the chart (default: 600).
     - w: int - The height of the chart (default: 300).
+    - aggregated: bool - Whether to use pre-aggregated data, see get_view_data.
 
     Returns:
     - bar_chart: LayeredChart - The layered bar chart visualizing the data.
 
     """
-    df = df[filter_cols]
+    df = get_view_data(df, "factor", aggregated)
     return (
         alt.Chart(df)
         .mark_bar()
         .transform_filter(
-            selection_buro
-            & selection_acc_map
-            & selection_cond
-            & selection_month
-            & selection_weekday
-            & selection_vehicle
-            & time_brush
-            & selection_injured
-            & selection_week
+            get_filter(
+                aggregated,
+                selection_buro
+                & selection_acc_map
+                & selection_cond
+                & selection_month
+                & selection_weekday
+                & selection_vehicle
+                & time_brush
+                & selection_injured
+                & selection_week
+            )
         )
         .encode(
             y=alt.Y(
@@ -1035,7 +2339,8 @@ def get_factor_chart(
             ],
         )
         .transform_aggregate(
-            counter="count()", groupby=["CONTRIBUTING FACTOR VEHICLE 1"]
+            counter=get_count(aggregated, typed=False),
+            groupby=["CONTRIBUTING FACTOR VEHICLE 1"],
         )
         .transform_window(
             rank="rank(counter)", sort=[alt.SortField("counter", order="descending")]
@@ -1047,29 +2352,281 @@ def get_factor_chart(
     )
 
 
-def make_visualization(accident_data, use_interval=True):
+def _get_children(chart):
+    """
+    Returns the charts nested in a layered, concatenated or faceted chart.
+    """
+    children = []
+    for attr in ["layer", "hconcat", "vconcat", "concat"]:
+        charts = getattr(chart, attr, None)
+        if isinstance(charts, list):
+            children += charts
+    spec = getattr(chart, "spec", None)
+    if isinstance(spec, alt.TopLevelMixin):
+        children.append(spec)
+    return children
+
+
+def _get_selection_fields(chart, selection_fields=None):
+    """
+    Returns the data fields of every selection parameter of a chart, by name.
+    """
+    if selection_fields is None:
+        selection_fields = {}
+    params = getattr(chart, "params", None)
+    for param in params if isinstance(params, list) else []:
+        # compound charts keep the lifted selections as plain dicts
+        select = getattr(param, "select", None)
+        if isinstance(select, dict):
+            fields = select.get("fields")
+        else:
+            fields = getattr(select, "fields", None)
+        if isinstance(fields, list):
+            selection_fields[param.name] = list(fields)
+    for child in _get_children(chart):
+        _get_selection_fields(child, selection_fields)
+    return selection_fields
+
+
+def _collect_fields(spec, selection_fields, fields):
+    """
+    Adds to fields the data fields referenced in a (part of a) Vega-Lite spec:
+    encoding and transform fields, groupbys, fields in expressions and the
+    fields of the selections it refers to.
+    """
+    if isinstance(spec, dict):
+        for key, value in spec.items():
+            if key == "field" and isinstance(value, str):
+                fields.add(value)
+            elif key == "groupby" and isinstance(value, list):
+                fields.update(value)
+            elif key == "param" and isinstance(value, str):
+                fields.update(selection_fields.get(value, []))
+            else:
+                _collect_fields(value, selection_fields, fields)
+    elif isinstance(spec, list):
+        for value in spec:
+            _collect_fields(value, selection_fields, fields)
+    elif isinstance(spec, str) and "datum" in spec:
+        for dotted, quoted in re.findall(
+            r"datum\.(\w+)|datum\[['\"](.+?)['\"]\]", spec
+        ):
+            fields.add(dotted or quoted)
+
+
+def _get_data_charts(chart):
+    """
+    Returns the charts (including chart itself) which have a DataFrame as data.
+    """
+    charts = [chart] if isinstance(getattr(chart, "data", None), pd.DataFrame) else []
+    for child in _get_children(chart):
+        charts += _get_data_charts(child)
+    return charts
+
+
+def project_data(chart):
+    """
+    Removes from the data of the views the columns none of them uses. The
+    columns a view needs are worked out from its spec: the fields it encodes
+    or transforms and the fields of the selections it filters on or
+    highlights.
+
+    Every view keeps the union of the columns needed by all the views, so that
+    views with the same data still share a single dataset. Projecting each view
+    to its own columns would give each one its own dataset, which is larger in
+    total, and in which Vega numbers the rows (_vgsid_) separately: the ids
+    held by the interval selection of the map would then designate different
+    accidents in the other views.
+
+    Parameters:
+    - chart: Chart - The visualization, which is modified in place.
+
+    Returns:
+    - chart: Chart - The visualization with projected data.
+    """
+    selection_fields = _get_selection_fields(chart)
+    charts = _get_data_charts(chart)
+    needed = []
+    for view in charts:
+        spec = view.copy(deep=False)
+        spec.data = alt.Undefined
+        fields = set()
+        _collect_fields(spec.to_dict(validate=False), selection_fields, fields)
+        needed.append(fields)
+    fields = set().union(*needed)
+    for view in charts:
+        view.data = view.data[[c for c in view.data.columns if c in fields]]
+    return chart
+
+
+def _get_units(chart):
+    """
+    Returns the unit charts drawing the data of chart: chart itself or its
+    nested charts which do not have their own data.
+    """
+    if isinstance(chart, alt.Chart):
+        return [chart]
+    units = []
+    for child in _get_children(chart):
+        if not isinstance(getattr(child, "data", None), pd.DataFrame):
+            units += _get_units(child)
+    return units
+
+
+def encode_data(chart):
+    """
+    Dictionary-encodes the string columns of the data of each view. Each value
+    is replaced by a small integer code, in a column with a short name, and
+    every view gets a lookup transform which joins back the original column
+    from a table of codes and values. Selections, tooltips and sorts keep
+    working on the decoded values. The tables are embedded once and shared by
+    all the views.
+
+    Parameters:
+    - chart: Chart - The visualization, which is modified in place.
+
+    Returns:
+    - chart: Chart - The visualization with encoded data.
+    """
+    charts = _get_data_charts(chart)
+    columns = sorted(
+        {
+            col
+            for view in charts
+            for col in view.data.columns
+            if not pd.api.types.is_numeric_dtype(view.data[col])
+            and not pd.api.types.is_datetime64_any_dtype(view.data[col])
+        }
+    )
+    # the same codes are used in every view, so that equal data stays equal
+    # and is still embedded once
+    categories = {
+        col: pd.Index(
+            sorted(
+                set().union(
+                    *(
+                        view.data[col].dropna().unique()
+                        for view in charts
+                        if col in view.data.columns
+                    )
+                )
+            )
+        )
+        for col in columns
+    }
+    keys = {col: f"k{i}" for i, col in enumerate(columns)}
+    tables = {
+        col: pd.DataFrame({keys[col]: range(len(values)), col: values})
+        for col, values in categories.items()
+    }
+
+    for view in charts:
+        encoded = [col for col in columns if col in view.data.columns]
+        data = view.data.copy()
+        for col in encoded:
+            # missing values get the code -1, which is not in the table
+            data[col] = categories[col].get_indexer(data[col])
+        view.data = data.rename(columns=keys)
+        lookups = [
+            alt.LookupTransform(
+                lookup=keys[col],
+                **{"from": alt.LookupData(data=tables[col], key=keys[col], fields=[col])},
+            )
+            for col in encoded
+        ]
+        for unit in _get_units(view):
+            transform = unit.transform if isinstance(unit.transform, list) else []
+            unit.transform = lookups + transform
+    return chart
+
+
+def make_visualization(
+    accident_data,
+    use_interval=True,
+    aggregated=False,
+    grid=0.005,
+    w=800,
+    projection="shared",
+    dictionary=False,
+    density=None,
+    resolution="medium",
+    filter_points=False,
+    render="default",
+):
     """
     It creates the whole visualization, with all the charts and interactivity.
 
     Parameters:
     - accident_data: DataFrame - The input DataFrame containing the data for the chart.
+    - use_interval: bool - Whether the map has an interval selection.
+    - aggregated: bool or str - Whether to precompute the counts of each view in
+      Python instead of embedding the accidents, see get_view_data. The views
+      are then not cross-filtered. With "crossfilter", the views read their
+      counts from named datasets which are not included in the chart, see
+      crossfilter.CrossFilter, and accident_data is not used.
+    - grid: float - When aggregated, the size in degrees of the grid the
+      accident coordinates are snapped to.
+    - w: int - The width of the top row of the visualization.
+    - projection: str - "shared" to remove the columns not used by any view
+      from their data (see project_data), or None to keep them all.
+    - dictionary: bool - Whether to send the string columns as integer codes
+      and lookup tables, see encode_data.
+    - density: str, optional - Whether the map draws the density of the
+      accidents in hexagonal ("hex") or square ("square") cells instead of
+      each accident, see get_map_chart. Not available with "crossfilter",
+      where the map already counts the accidents on a grid.
+    - resolution: str - The size of the cells of the density map, one of
+      map_resolutions. Only the cells of this size are in the chart.
+    - filter_points: bool - Whether the map removes the accidents outside of
+      its selections instead of hiding them, see get_map_chart. Not used with
+      density or "crossfilter".
+    - render: str or dict - The rendering profile, one of render_profiles or
+      a dict with the same keys.
 
     Returns:
     - chart: LayeredChart - The layered chart visualizing the data.
     """
-    w = 600
     h = 400
     ratio = 0.2
-    selection_cond = alt.selection_point(on="click", fields=["conditions"])
-    selection_buro = alt.selection_point(fields=["name"])
-    selection_vehicle = alt.selection_point(on="click", fields=["VEHICLE TYPE CODE 1"])
-    time_brush = alt.selection_point(fields=["HOUR"])
-    selection_injured = alt.selection_point(fields=["INJURED"])
-    selection_week = alt.selection_point(fields=["week"])
-    selection_weekday = alt.selection_point(fields=["dayname"])
+    if aggregated == "crossfilter":
+        density = None
+        filter_points = False
+    profile = render_profiles[render] if isinstance(render, str) else render
+    # the density map has no interval selection, see get_map_chart
+    use_interval = use_interval and not density
+    # The selections are named, so that their state can be read back (see
+    # crossfilter.py)
+    fields = selection_fields
+    selection_cond = alt.selection_point(
+        name="selection_cond", on="click", fields=fields["selection_cond"]
+    )
+    selection_buro = alt.selection_point(
+        name="selection_buro", fields=fields["selection_buro"]
+    )
+    selection_vehicle = alt.selection_point(
+        name="selection_vehicle", on="click", fields=fields["selection_vehicle"]
+    )
+    time_brush = alt.selection_point(name="time_brush", fields=fields["time_brush"])
+    selection_injured = alt.selection_point(
+        name="selection_injured", fields=fields["selection_injured"]
+    )
+    selection_week = alt.selection_point(
+        name="selection_week", fields=fields["selection_week"]
+    )
+    selection_weekday = alt.selection_point(
+        name="selection_weekday", fields=fields["selection_weekday"]
+    )
 
     if use_interval:
-        selection_acc_map = alt.selection_interval(fields=["LATITUDE", "LONGITUDE"])
+        events = {}
+        if profile["throttle"]:
+            # the default events of the brush, at most once every throttle ms
+            move = f"window:pointermove!{{{profile['throttle']}}}"
+            drag = f"[pointerdown, window:pointerup] > {move}"
+            events = {"on": drag, "translate": drag}
+        selection_acc_map = alt.selection_interval(
+            name="selection_acc_map", fields=fields["selection_acc_map"], **events
+        )
     else:
         selection_acc_map = selection_buro
     month_dropdown = alt.binding_select(
@@ -1083,31 +2640,23 @@ def make_visualization(accident_data, use_interval=True):
         name="month",
         labels=["All", "June", "July", "August", "September"],
     )
-    selection_month = alt.selection_point(fields=["monthname"])
-    selection_acc_factor = alt.selection_point(fields=["CONTRIBUTING FACTOR VEHICLE 1"])
-
-    cols = [
-        "CRASH DATE",
-        "LATITUDE",
-        "LONGITUDE",
-        "date",
-        "HOUR",
-        "week",
-        "weekday",
-        "month",
-        "name",
-        "VEHICLE TYPE CODE 1",
-        "CONTRIBUTING FACTOR VEHICLE 1",
-        "dayname",
-        "monthname",
-        "conditions",
-        "fulldate",
-        "INJURED",
-        "num_days_in_month",
-    ]
+    selection_month = alt.selection_point(
+        name="selection_month", fields=fields["selection_month"]
+    )
+    selection_acc_factor = alt.selection_point(
+        name="selection_acc_factor", fields=fields["selection_acc_factor"]
+    )
 
-    accident_data = accident_data[cols]
-    w = 800
+    if aggregated != "crossfilter":
+        accident_data = accident_data[vis_cols]
+    if aggregated is True and not density:
+        accident_data = snap_coordinates(accident_data, grid)
+    cells = None
+    if density:
+        cell = map_resolutions[resolution]
+        ids, cells = get_cells(accident_data, density, cell)
+        accident_data = accident_data.assign(cell=ids)
+        cells = get_cell_features(cells, density, cell)
     geo_view, bur_chart = get_map_chart(
         accident_data,
         selection_buro,
@@ -1125,6 +2674,11 @@ def make_visualization(accident_data, use_interval=True):
         w=w,
         ratio=0.7,
         use_interval=use_interval,
+        aggregated=aggregated,
+        density=density,
+        cells=cells,
+        filter_points=filter_points,
+        tooltips=profile["dense_tooltips"],
     )
     weather = get_weather_chart(
         accident_data,
@@ -1141,6 +2695,7 @@ def make_visualization(accident_data, use_interval=True):
         h=399,
         w=w * 0.8,
         ratio=0.8,
+        aggregated=aggregated,
     )
     calendar = get_calendar_chart(
         accident_data,
@@ -1156,6 +2711,8 @@ def make_visualization(accident_data, use_interval=True):
         selection_week,
         h=550,
         w=w * 0.3,
+        aggregated=aggregated,
+        tooltips=profile["dense_tooltips"],
     )
     months = get_month_chart(
         accident_data,
@@ -1171,6 +2728,7 @@ def make_visualization(accident_data, use_interval=True):
         selection_week,
         h=550,
         w=w * 0.3,
+        aggregated=aggregated,
     )
     vehicles = get_vehicle_chart(
         accident_data,
@@ -1186,6 +2744,7 @@ def make_visualization(accident_data, use_interval=True):
         selection_week,
         h=200,
         w=w * 0.3,
+        aggregated=aggregated,
     )
     time_of_day = get_time_of_day_chart(
         accident_data,
@@ -1201,6 +2760,7 @@ def make_visualization(accident_data, use_interval=True):
         selection_week,
         h=250,
         w=600,
+        aggregated=aggregated,
     )
     acc_factor = get_factor_chart(
         accident_data,
@@ -1216,6 +2776,7 @@ def make_visualization(accident_data, use_interval=True):
         selection_week,
         h=200,
         w=450,
+        aggregated=aggregated,
     )
 
     counts = get_counts_chart(
@@ -1232,10 +2793,23 @@ def make_visualization(accident_data, use_interval=True):
         selection_week,
         h=70,
         w=100,
+        aggregated=aggregated,
     )
     chart = (geo_view | (counts & ((bur_chart & vehicles) | weather))) & (
         (months | calendar).resolve_scale(color="shared")
         | ((time_of_day & acc_factor).resolve_scale(color="independent"))
     )
-
+    if density:
+        # the log color scale of the density cells is not merged with the
+        # quantitative color scales of the other charts
+        chart = chart.resolve_scale(color="independent")
+
+    if projection not in ("shared", None):
+        raise ValueError(f"Unknown projection {projection!r}")
+    if projection is not None:
+        chart = project_data(chart)
+    if dictionary:
+        chart = encode_data(chart)
+    if profile["embed"]:
+        chart = chart.properties(usermeta={"embedOptions": profile["embed"]})
     return chart
@@ -1,12 +1,82 @@
+import os
+import re
+
 from streamlit.components.v1 import html
 import streamlit as st
 
+# The pregenerated HTML version of the visualization
+page_path = "visualization.html"
+# Directory of the files Streamlit serves at app/static/ when
+# server.enableStaticServing is set (see .streamlit/config.toml)
+static_dir = "static"
+spec_name = "visualization.json"
+
+
+@st.cache_resource(max_entries=1)
+def load_page(path, mtime):
+    """
+    Reads the pregenerated page. It is read once and shared by all the
+    sessions, until the file is modified.
+
+    Parameters:
+    - path: str - Path to the HTML file.
+    - mtime: float - Modification time of the file, only used as the cache key.
+
+    Returns:
+    - page: str - The HTML page.
+    """
+    with open(path, "r") as f:
+        return f.read()
+
+
+@st.cache_resource(max_entries=1)
+def load_static_page(path, mtime):
+    """
+    Moves the chart specification, with all its data, out of the pregenerated
+    page into a static file, so that the browser downloads it over HTTP,
+    compressed by the server and cached, instead of through the websocket on
+    every rerun.
+
+    Parameters:
+    - path: str - Path to the HTML file.
+    - mtime: float - Modification time of the file, only used as the cache key.
+
+    Returns:
+    - page: str or None - The page, loading the specification from the static
+      file, or None if it could not be written.
+    """
+    page = load_page(path, mtime)
+    match = re.search(r"var spec = (\{.*\});\n", page)
+    if match is None:
+        return None
+    spec_path = os.path.join(static_dir, spec_name)
+    try:
+        os.makedirs(static_dir, exist_ok=True)
+        # written to a temporary file first, as other processes may be serving
+        # the previous one
+        with open(spec_path + ".tmp", "w") as f:
+            f.write(match.group(1))
+        os.replace(spec_path + ".tmp", spec_path)
+    except OSError:
+        return None
+    # vega-embed loads a specification given as an URL, relative to the page
+    return (
+        page[: match.start()]
+        + f'var spec = "app/static/{spec_name}";\n'
+        + page[match.end() :]
+    )
+
+
 st.title("Pregenerated HTML version of the visualization")
 # write a disclaimer writing that this is a pregenerated html version of the chart, based on the chart shown on the jupyter notebook
 st.write(
     "This is a pregenerated HTML version of the visualization. It is not interactive, but it is a good way to see the visualization in case there are technical issues. The code for this visualization can be found in the `pages` folder of the repository."
 )
-with open("visualization.html", "r") as f:
-    page = f.read()
+mtime = os.path.getmtime(page_path)
+page = None
+if st.get_option("server.enableStaticServing"):
+    page = load_static_page(page_path, mtime)
+if page is None:
+    page = load_page(page_path, mtime)
 
 html(page, width=1500, height=3000)
@@ -0,0 +1,75 @@
+"""
+Lookup of the weather observation of each accident.
+"""
+import numpy as np
+import pandas as pd
+
+
+class WeatherLookup:
+    """
+    Finds the weather observation corresponding to each of a set of times.
+
+    Daily observations are stored in an array indexed by day, from the first
+    observed day, which holds the position of the observation of each day (or
+    -1), so that a lookup is a single array indexing. Other observations, such
+    as hourly ones, are matched with an as-of join: each time gets the last
+    observation at or before it, if it is not older than the tolerance.
+
+    Parameters:
+    - times: array of datetime64 - Times of the observations.
+    - tolerance: Timedelta - Maximum age of the observation matched to a time,
+      for non-daily observations.
+    """
+
+    MISSING = -1
+
+    def __init__(self, times, tolerance=pd.Timedelta(hours=1)):
+        times = pd.DatetimeIndex(times)
+        self.daily = bool((times == times.normalize()).all()) and times.is_unique
+        if self.daily:
+            days = self._days(times.to_numpy())
+            self.origin = days.min()
+            self.positions = np.full(
+                days.max() - self.origin + 1, self.MISSING, dtype=np.int64
+            )
+            self.positions[days - self.origin] = np.arange(len(days))
+        else:
+            self.order = np.argsort(times.to_numpy(), kind="stable")
+            self.times = times.to_numpy()[self.order]
+            self.tolerance = np.timedelta64(tolerance)
+
+    @staticmethod
+    def _days(times):
+        """
+        Returns the day ordinal (days since the epoch) of each time.
+        """
+        return times.astype("datetime64[D]").astype(np.int64)
+
+    def lookup(self, times):
+        """
+        Finds the observation of each time.
+
+        Parameters:
+        - times: array of datetime64 - The times to look up. For daily
+          observations, only their day is used.
+
+        Returns:
+        - idx: array of int - Position of the observation of each time, or -1
+          if there is none (or the time is missing).
+        """
+        times = np.asarray(times, dtype="datetime64[ns]")
+        idx = np.full(len(times), self.MISSING, dtype=np.int64)
+        valid = ~np.isnat(times)
+        if self.daily:
+            days = self._days(times[valid]) - self.origin
+            inside = (days >= 0) & (days < len(self.positions))
+            (rows,) = np.nonzero(valid)
+            idx[rows[inside]] = self.positions[days[inside]]
+        else:
+            pos = np.searchsorted(self.times, times[valid], side="right") - 1
+            (rows,) = np.nonzero(valid)
+            found = pos >= 0
+            rows, pos = rows[found], pos[found]
+            recent = times[rows] - self.times[pos] <= self.tolerance
+            idx[rows[recent]] = self.order[pos[recent]]
+        return idx